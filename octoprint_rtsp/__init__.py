@@ -1,15 +1,36 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+import os
 import threading
 import time
 import octoprint.plugin
 import flask
-import urllib.request
-import urllib.error
 import tornado.web
 import tornado.gen
+import tornado.ioloop
+from octoprint.events import Events
 from .streamor import Streamor
+from .profiles import IDLE, PRINTING
+from .scheduling import SchedulingProfile
+from .memory import budget
+from .diagnostics import DiagnosticsCollector
+from .sources import MAIN, SUB, SourceSet
+from .regions import parse_regions
+from .ptz import PtzClient, PtzQueueFull
+
+# Webcam provider API, OctoPrint 1.9+
+try:
+    from octoprint.schema.webcam import Webcam, WebcamCompatibility
+    from octoprint.webcams import WebcamNotAbleToTakeSnapshotException
+except ImportError:
+    Webcam = WebcamCompatibility = None
+    WebcamNotAbleToTakeSnapshotException = Exception
+
+WEBCAM_LIVE = "rtsp"
+WEBCAM_STILL = "rtsp_still"
+WEBCAM_SUB = "rtsp_sub"
+WEBCAM_REGION = "rtsp_roi_"  # + region name
 
 # Global reference to plugin instance for Tornado handler
 _plugin_instance = None
@@ -43,26 +64,37 @@ class MjpegStreamHandler(tornado.web.RequestHandler):
             self.finish("RTSP URL not configured")
             return
 
-        # Ensure streamor is running
-        with plugin._streamor_lock:
-            if not plugin._streamor:
-                plugin.on_settings_save({})
-            if plugin._streamor and not plugin._streamor.running:
-                plugin._streamor.start()
-
-        if not plugin._streamor:
+        # Ensure the requested source (main or sub stream) is running
+        roi = self.get_argument("roi", None)
+        if roi:
+            streamor = plugin._ensure_region(roi)
+            if not streamor:
+                self.set_status(404)
+                self.finish("Unknown region of interest")
+                return
+        else:
+            streamor = plugin._ensure_streamor(self.get_argument("source", MAIN))
+        if not streamor:
             self.set_status(500)
             self.finish("Streamor not available")
             return
 
-        # Wait for first frame
-        first_frame = None
-        for _ in range(50):  # Wait up to 5 seconds
-            first_frame = plugin._streamor.get_snapshot()
-            if first_frame:
-                break
-            yield tornado.gen.sleep(0.1)
+        # Cold start: answer right away with the persisted poster frame while
+        # the pipeline warms up, otherwise wait for the first live frame
+        first_frame = streamor.get_snapshot()
+        stale_age = None
+        if not first_frame:
+            first_frame, stale_age = streamor.get_poster()
+
+        if not first_frame:
+            for _ in range(50):  # Wait up to 5 seconds
+                first_frame = streamor.get_snapshot()
+                if first_frame or self._closed:
+                    break
+                yield tornado.gen.sleep(0.1)
 
+        if self._closed:
+            return
         if not first_frame:
             self.set_status(503)
             self.finish("No frames available")
@@ -74,74 +106,109 @@ class MjpegStreamHandler(tornado.web.RequestHandler):
         self.set_header("Pragma", "no-cache")
         self.set_header("Expires", "0")
         self.set_header("Connection", "close")
+        if stale_age is not None:
+            # Only the first part is the poster, later parts are live
+            self.set_header("X-First-Frame-Stale", "1")
 
-        plugin._logger.info(f"Streaming first frame: {len(first_frame)} bytes")
+        plugin._logger.info(f"Streaming first frame: {len(first_frame)} bytes"
+                            + (f" (poster, {stale_age:.0f}s old)" if stale_age is not None else ""))
 
         # Send first frame
+        last_seq = streamor.frame_seq
         try:
-            self.write(b"--frame\r\n")
-            self.write(b"Content-Type: image/jpeg\r\n")
-            self.write(f"Content-Length: {len(first_frame)}\r\n\r\n".encode())
-            self.write(first_frame)
-            self.write(b"\r\n")
+            self._write_part(first_frame, stale_age)
             yield self.flush()
+        except tornado.iostream.StreamClosedError:
+            plugin._logger.info("Stream closed by client before the first frame")
+            return
         except Exception as e:
             plugin._logger.error(f"Error sending first frame: {e}")
             return
 
         # Stream continuously
         frame_count = 1
-        streamor = plugin._streamor
-
-        while not self._closed and streamor and streamor.running:
-            # Get frame (with brief wait)
-            frame = None
-            with streamor._condition:
-                streamor._condition.wait(timeout=0.5)
-                frame = streamor.last_frame
-
-            if frame and not self._closed:
-                frame_count += 1
-                if frame_count % 30 == 0:  # Log every ~2 seconds
-                    plugin._logger.info(f"Streamed {frame_count} frames")
-
-                try:
-                    self.write(b"--frame\r\n")
-                    self.write(b"Content-Type: image/jpeg\r\n")
-                    self.write(f"Content-Length: {len(frame)}\r\n\r\n".encode())
-                    self.write(frame)
-                    self.write(b"\r\n")
-                    yield self.flush()
-                except tornado.iostream.StreamClosedError:
-                    plugin._logger.info("Stream closed by client")
-                    break
-                except Exception as e:
-                    plugin._logger.error(f"Error streaming frame: {e}")
-                    break
+        streamor.clients += 1
+
+        try:
+            while not self._closed and streamor and streamor.running:
+                # Get frame (with brief wait, without blocking the IOLoop) - only
+                # published frames wake us, so suppressed static frames are never re-sent
+                latest = yield streamor.next_frame(last_seq, timeout=0.5)
+                if latest and not self._closed:
+                    frame, seq, captured = latest
+                    frame_count += 1
+                    if frame_count % 30 == 0:  # Log every ~2 seconds
+                        plugin._logger.info(f"Streamed {frame_count} frames")
+
+                    try:
+                        # One shared part per frame, whatever the number of clients
+                        self.write(streamor.get_part(frame))
+                        yield self.flush()
+                    except tornado.iostream.StreamClosedError:
+                        plugin._logger.info("Stream closed by client")
+                        break
+                    except Exception as e:
+                        plugin._logger.error(f"Error streaming frame: {e}")
+                        break
+
+                    # Frames published while we were flushing never reached this
+                    # client - the quality controller treats that as back pressure
+                    streamor.count_client_frame(len(frame), max(0, seq - last_seq - 1),
+                                                time.time() - captured)
+                    last_seq = seq
+        finally:
+            streamor.clients -= 1
 
         plugin._logger.info(f"Stream ended after {frame_count} frames")
 
+    def _write_part(self, frame, stale_age=None):
+        # First frame only - live frames use the shared Streamor.get_part()
+        self.write(b"--frame\r\n")
+        self.write(b"Content-Type: image/jpeg\r\n")
+        if stale_age is not None:
+            # Poster frame from disk, not a live capture
+            self.write(f"X-Frame-Stale: 1\r\nAge: {int(stale_age)}\r\n".encode())
+        self.write(f"Content-Length: {len(frame)}\r\n\r\n".encode())
+        self.write(frame)
+        self.write(b"\r\n")
+
 
 class RtspPlugin(octoprint.plugin.StartupPlugin,
                  octoprint.plugin.SettingsPlugin,
                  octoprint.plugin.AssetPlugin,
                  octoprint.plugin.TemplatePlugin,
-                 octoprint.plugin.BlueprintPlugin):
+                 octoprint.plugin.BlueprintPlugin,
+                 octoprint.plugin.EventHandlerPlugin,
+                 getattr(octoprint.plugin, "WebcamProviderPlugin", object)):
 
     def __init__(self):
-        self._streamor = None
+        self._streamor = None  # main stream source
+        self._sources = None
+        self._loop = None
         self._streamor_lock = threading.Lock()
+        self._ptz = None
+        self._diagnostics = DiagnosticsCollector(lambda: self._streamor, self._send_diagnostics)
+
+    def on_startup(self, host, port):
+        # Called on the main thread: this is the IOLoop the server will run,
+        # asynchronous capture backends are scheduled on it
+        self._loop = getattr(tornado.ioloop.IOLoop.current(), "asyncio_loop", None)
 
     def on_after_startup(self):
         global _plugin_instance
         _plugin_instance = self
         self._logger.info("OctoPrint-RTSP loaded!")
+        self._ptz = PtzClient(logger=self._logger)
         # Load settings and init streamor
         self.on_settings_save({})
 
     def get_settings_defaults(self):
         return dict(
             rtsp_url="",
+            # Optional low resolution sub stream, used for thumbnails, dashboards and monitoring snapshots
+            rtsp_sub_url="",
+            # Stop a source without viewers after this many seconds, 0 = keep running
+            source_idle_timeout=60,
             username="",
             password="",
             # Streaming
@@ -149,10 +216,42 @@ class RtspPlugin(octoprint.plugin.StartupPlugin,
             stream_resolution="", # e.g. 640x480
             stream_bitrate="",    # e.g. 1000k
             ffmpeg_custom_args="",
+            ffmpeg_path="ffmpeg",
+            capture_backend="ffmpeg", # ffmpeg, asyncio, pyav, replay (rtsp_url is then a recording file) or relay (rtsp_url is another instance's /plugin/rtsp/stream)
+            # Scheduling of the capture pipeline, applied when ffmpeg is spawned
+            ffmpeg_nice="", # empty = inherit OctoPrint's, e.g. 10 to yield to it
+            ffmpeg_ionice="", # "", "best-effort" or "idle"
+            ffmpeg_cpu_affinity="", # e.g. "1-3" to keep core 0 for OctoPrint
+            ffmpeg_threads=0, # 0 = ffmpeg decides
+            replay_speed=1.0, # 0 = as fast as possible
+            # Static-scene suppression
+            suppress_static=False,
+            suppress_threshold=1.0, # largest luma thumbnail change in percent
+            suppress_keepalive=2.0, # seconds
+            # Last good frame kept on disk for instant cold-start responses
+            poster_interval=60, # seconds, 0 disables
+            # JPEG -q:v for high quality stills (timelapse via the "rtsp_still" webcam, /snapshot?still=1)
+            still_quality=2,
+            # Process wide cap for frame data; caches are dropped first when reached
+            memory_budget_mb=64,
+            # Run capture in a separate process
+            capture_process=False,
+            # Lower quality/frame rate/resolution under CPU or bandwidth pressure
+            adaptive_quality=False,
+            # Release frames on a steady clock; bursts are dropped, never queued
+            pacing=False,
+            pacing_max_latency=100, # ms
+            # Lighter capture while printing, so video can't starve the serial link
+            printing_profile=False,
+            printing_fps=5,
+            printing_resolution="", # empty = same as stream_resolution
+            printing_keyframes_only=False,
             # Orientation
             flip_h=False,
             flip_v=False,
             rotate_90=False,
+            # Regions of interest, one "name = x,y,width,height" (percent) per line
+            regions="",
             # PTZ
             use_ptz=False,
             ptz_url_left="",
@@ -168,6 +267,7 @@ class RtspPlugin(octoprint.plugin.StartupPlugin,
         octoprint.plugin.SettingsPlugin.on_settings_save(self, data)
 
         rtsp_url = self._settings.get(["rtsp_url"])
+        budget.limit = (self._settings.get_int(["memory_budget_mb"]) or 64) * 1024 * 1024
         flip_h = self._settings.get_boolean(["flip_h"])
         flip_v = self._settings.get_boolean(["flip_v"])
         rotate_90 = self._settings.get_boolean(["rotate_90"])
@@ -177,22 +277,191 @@ class RtspPlugin(octoprint.plugin.StartupPlugin,
         current_fps = self._settings.get_int(["stream_fps"])
         bitrate = self._settings.get(["stream_bitrate"])
         custom_args = self._settings.get(["ffmpeg_custom_args"])
+        suppress_static = self._settings.get_boolean(["suppress_static"])
+        suppress_threshold = self._settings.get_float(["suppress_threshold"])
+        suppress_keepalive = self._settings.get_float(["suppress_keepalive"])
+        capture_process = self._settings.get_boolean(["capture_process"])
+        poster_interval = self._settings.get_int(["poster_interval"])
+        ffmpeg_path = self._settings.get(["ffmpeg_path"])
+        capture_backend = self._settings.get(["capture_backend"])
+        replay_speed = self._settings.get_float(["replay_speed"])
+        adaptive_quality = self._settings.get_boolean(["adaptive_quality"])
+        pacing = self._settings.get_boolean(["pacing"])
+        pacing_max_latency = self._settings.get_int(["pacing_max_latency"])
+
+        scheduling = SchedulingProfile(
+            nice=self._settings.get_int(["ffmpeg_nice"]),
+            ionice=self._settings.get(["ffmpeg_ionice"]),
+            cpu_affinity=self._settings.get(["ffmpeg_cpu_affinity"]),
+            threads=self._settings.get_int(["ffmpeg_threads"]),
+        )
 
-        if self._streamor:
-            self._streamor.stop()
+        profiles = {}
+        if self._settings.get_boolean(["printing_profile"]):
+            profiles[PRINTING] = dict(
+                framerate=self._settings.get_int(["printing_fps"]),
+                resolution=self._settings.get(["printing_resolution"]),
+                keyframes_only=self._settings.get_boolean(["printing_keyframes_only"]),
+            )
 
-        # Initialize new streamor with new settings
-        self._streamor = Streamor(
-            url=rtsp_url,
+        regions, errors = parse_regions(self._settings.get(["regions"]))
+        for error in errors:
+            self._logger.warning(f"Ignoring {error}")
+
+        if self._sources:
+            self._sources.stop()
+
+        # Initialize new streamors with new settings
+        options = dict(
             flip_h=flip_h,
             flip_v=flip_v,
             rotate_90=rotate_90,
-            resolution=resolution,
             framerate=current_fps,
             bitrate=bitrate,
             custom_cmd=custom_args,
-            logger=self._logger
+            logger=self._logger,
+            suppress_static=suppress_static,
+            suppress_threshold=suppress_threshold if suppress_threshold is not None else 1.0,
+            suppress_keepalive=suppress_keepalive if suppress_keepalive is not None else 2.0,
+            capture_process=capture_process,
+            poster_interval=poster_interval or 0,
+            ffmpeg_path=ffmpeg_path,
+            cache_dir=self.get_plugin_data_folder(),
+            backend=capture_backend,
+            replay_speed=replay_speed if replay_speed is not None else 1.0,
+            adaptive_quality=adaptive_quality,
+            scheduling=scheduling,
+            loop=self._loop,
+            pacing=pacing,
+            pacing_max_latency=(pacing_max_latency if pacing_max_latency is not None else 100) / 1000.0
         )
+        self._streamor = Streamor(
+            url=rtsp_url,
+            resolution=resolution,
+            poster_path=os.path.join(self.get_plugin_data_folder(), "poster.jpg"),
+            profiles=profiles,
+            regions=regions,
+            **options
+        )
+        sources = {MAIN: self._streamor}
+
+        sub_url = self._settings.get(["rtsp_sub_url"])
+        if sub_url:
+            # Already small - keep its size rather than scaling to the main stream's
+            sources[SUB] = Streamor(
+                url=sub_url,
+                poster_path=os.path.join(self.get_plugin_data_folder(), "poster_sub.jpg"),
+                profiles={name: dict(profile, resolution=None) for name, profile in profiles.items()},
+                **options
+            )
+
+        idle_timeout = self._settings.get_float(["source_idle_timeout"])
+        self._sources = SourceSet(sources, idle_timeout=idle_timeout if idle_timeout is not None else 60.0,
+                                  logger=self._logger)
+        if self._printer.is_printing():
+            self._sources.set_profile(PRINTING)
+
+    def on_event(self, event, payload):
+        if event in (Events.PRINT_STARTED, Events.PRINT_RESUMED):
+            profile = PRINTING
+        elif event in (Events.PRINT_DONE, Events.PRINT_FAILED, Events.PRINT_CANCELLED, Events.PRINT_PAUSED):
+            profile = IDLE
+        else:
+            return
+
+        sources = self._sources
+        if sources and sources.set_profile(profile):
+            self._logger.info(f"Switched camera to '{profile}' profile on {event}")
+
+    def _ensure_streamor(self, source=MAIN):
+        """Returns the running streamor for source ("main" or "sub", the main
+        stream if no sub stream is configured), creating and starting it if
+        needed."""
+        with self._streamor_lock:
+            if not self._sources:
+                self.on_settings_save({})
+            return self._sources.acquire(source) if self._sources else None
+
+    def _still_streamor(self):
+        """Returns the main streamor for a high quality still, without starting
+        it: the still's one-shot ffmpeg opens its own RTSP session, starting
+        the live stream as well would open a second one for every frame."""
+        with self._streamor_lock:
+            if not self._sources:
+                self.on_settings_save({})
+            return self._sources.get(MAIN) if self._sources else None
+
+    def _ensure_region(self, name):
+        """Returns the rendition of region name, cropped from the running
+        main stream, or None if there is no such region."""
+        streamor = self._ensure_streamor(MAIN)
+        return streamor.regions.get(name) if streamor else None
+
+    # WebcamProviderPlugin mixin - timelapse and other plugins get frames
+    # straight from the Streamor instead of looping back through /snapshot
+    def get_webcam_configurations(self):
+        if Webcam is None or not self._settings.get(["rtsp_url"]):
+            return []
+
+        compat = WebcamCompatibility(stream="/plugin/rtsp/stream", snapshot="/plugin/rtsp/snapshot")
+        webcams = [
+            Webcam(
+                name=WEBCAM_LIVE,
+                displayName="RTSP Camera",
+                canSnapshot=True,
+                snapshotDisplay="Latest frame of the live stream (in memory)",
+                compat=compat,
+                extras=dict(stream="/plugin/rtsp/stream"),
+            ),
+            Webcam(
+                name=WEBCAM_STILL,
+                displayName="RTSP Camera (high quality stills)",
+                canSnapshot=True,
+                snapshotDisplay="Full-size still taken next to the live stream",
+                compat=compat,
+                extras=dict(stream="/plugin/rtsp/stream"),
+            ),
+        ]
+        if self._settings.get(["rtsp_sub_url"]):
+            webcams.append(Webcam(
+                name=WEBCAM_SUB,
+                displayName="RTSP Camera (sub stream)",
+                canSnapshot=True,
+                snapshotDisplay="Latest frame of the low resolution sub stream (in memory)",
+                compat=WebcamCompatibility(stream="/plugin/rtsp/stream?source=sub",
+                                           snapshot="/plugin/rtsp/snapshot?source=sub"),
+                extras=dict(stream="/plugin/rtsp/stream?source=sub"),
+            ))
+        regions, _ = parse_regions(self._settings.get(["regions"]))
+        for name in regions:
+            webcams.append(Webcam(
+                name=WEBCAM_REGION + name,
+                displayName=f"RTSP Camera ({name})",
+                canSnapshot=True,
+                snapshotDisplay=f"Latest frame of the '{name}' region of interest (in memory)",
+                compat=WebcamCompatibility(stream=f"/plugin/rtsp/stream?roi={name}",
+                                           snapshot=f"/plugin/rtsp/snapshot?roi={name}"),
+                extras=dict(stream=f"/plugin/rtsp/stream?roi={name}"),
+            ))
+        return webcams
+
+    def take_webcam_snapshot(self, webcamName):
+        if webcamName.startswith(WEBCAM_REGION):
+            streamor = self._ensure_region(webcamName[len(WEBCAM_REGION):])
+        elif webcamName == WEBCAM_STILL:
+            streamor = self._still_streamor()
+        else:
+            streamor = self._ensure_streamor(SUB if webcamName == WEBCAM_SUB else MAIN)
+        if not streamor:
+            raise WebcamNotAbleToTakeSnapshotException(webcamName)
+
+        if webcamName == WEBCAM_STILL:
+            frame = streamor.capture_still(quality=self._settings.get_int(["still_quality"]) or 2)
+        else:
+            frame = streamor.wait_for_frame(timeout=5.0)
+        if not frame:
+            raise WebcamNotAbleToTakeSnapshotException(webcamName)
+        return iter((frame,))
 
     def get_template_configs(self):
         return [
@@ -221,23 +490,102 @@ class RtspPlugin(octoprint.plugin.StartupPlugin,
         if not rtsp_url:
             flask.abort(404)
 
-        # Ensure streamor exists and is running
-        with self._streamor_lock:
-            if not self._streamor:
-                self.on_settings_save({})
-            if self._streamor and not self._streamor.running:
-                self._streamor.start()
-
-        # Wait briefly for first frame if needed
-        if self._streamor:
-            for _ in range(50):  # Wait up to 5 seconds
-                frame = self._streamor.get_snapshot()
+        # Stills are always taken from the main stream
+        still = flask.request.values.get("still") in ("1", "true")
+        roi = flask.request.values.get("roi")
+        if roi and not still:
+            streamor = self._ensure_region(roi)
+            if not streamor:
+                flask.abort(404)
+        elif still:
+            streamor = self._still_streamor()
+        else:
+            streamor = self._ensure_streamor(flask.request.values.get("source", MAIN))
+
+        if streamor:
+            if still:
+                frame = streamor.capture_still(quality=self._settings.get_int(["still_quality"]) or 2)
                 if frame:
                     return flask.Response(frame, mimetype='image/jpeg')
-                time.sleep(0.1)
+                return flask.abort(503)
+
+            # Serve the persisted poster (marked stale) while warming up
+            if not streamor.get_snapshot():
+                poster, age = streamor.get_poster()
+                if poster:
+                    response = flask.Response(poster, mimetype='image/jpeg')
+                    response.headers["X-Frame-Stale"] = "1"
+                    response.headers["Age"] = str(int(age))
+                    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+                    return response
+
+            # Wait briefly for first frame if needed
+            frame = streamor.wait_for_frame(timeout=5.0)
+            if frame:
+                return flask.Response(frame, mimetype='image/jpeg')
 
         return flask.abort(503)
 
+    def _send_diagnostics(self, sample):
+        self._plugin_manager.send_plugin_message(self._identifier, dict(type="diagnostics", stats=sample))
+
+    # Live diagnostics while the settings dialog is open - it renews the lease
+    # every few seconds and ends it when closed
+    @octoprint.plugin.BlueprintPlugin.route("/diagnostics", methods=["POST"])
+    def diagnostics(self):
+        data = flask.request.get_json(silent=True) or {}
+        if data.get("enabled", True):
+            self._diagnostics.renew()
+        else:
+            self._diagnostics.stop()
+        return flask.jsonify(active=self._diagnostics.active, lease=self._diagnostics.lease)
+
+    @octoprint.plugin.BlueprintPlugin.route("/stats", methods=["GET"])
+    def stats(self):
+        if not self._sources:
+            return flask.jsonify(dict(running=False))
+
+        streamor = self._sources.get(flask.request.values.get("source", MAIN))
+        stats = streamor.get_stats()
+        stats["running"] = streamor.running
+        stats["sources"] = self._sources.get_stats()
+        return flask.jsonify(stats)
+
+    def _recordings_folder(self):
+        folder = os.path.join(self.get_plugin_data_folder(), "recordings")
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    @octoprint.plugin.BlueprintPlugin.route("/recording/start", methods=["POST"])
+    def start_recording(self):
+        streamor = self._ensure_streamor()
+        if not streamor:
+            return flask.Response("Streamor not available", status=503)
+
+        data = flask.request.get_json(silent=True) or {}
+        try:
+            max_duration = float(data.get("max_duration", 600))
+        except (TypeError, ValueError):
+            return flask.Response("Invalid max_duration", status=400)
+
+        name = time.strftime("capture-%Y%m%d-%H%M%S.orec")
+        streamor.start_recording(os.path.join(self._recordings_folder(), name),
+                                 max_duration=max_duration)
+        return flask.jsonify(name=name)
+
+    @octoprint.plugin.BlueprintPlugin.route("/recording/stop", methods=["POST"])
+    def stop_recording(self):
+        info = self._streamor.stop_recording() if self._streamor else None
+        if not info:
+            return flask.Response("Not recording", status=409)
+
+        info["name"] = os.path.basename(info.pop("path"))
+        return flask.jsonify(info)
+
+    @octoprint.plugin.BlueprintPlugin.route("/recordings/<filename>", methods=["GET"])
+    def download_recording(self, filename):
+        return flask.send_from_directory(self._recordings_folder(), filename, as_attachment=True)
+
     @octoprint.plugin.BlueprintPlugin.route("/control/<direction>", methods=["POST"])
     def control_ptz(self, direction):
         use_ptz = self._settings.get_boolean(["use_ptz"])
@@ -262,13 +610,19 @@ class RtspPlugin(octoprint.plugin.StartupPlugin,
         if not url:
              return flask.Response("URL not configured for this direction", status=400)
 
+        # Sent in the background - poll /control/status/<id> for the result
         try:
-            with urllib.request.urlopen(url, timeout=5) as response:
-                pass
-            return flask.Response("OK", status=200)
-        except Exception as e:
-            self._logger.error(f"PTZ Error: {e}")
-            return flask.Response(f"Error: {str(e)}", status=502)
+            command = self._ptz.submit(direction, url)
+        except PtzQueueFull:
+            return flask.Response("Too many PTZ commands pending", status=429)
+        return flask.jsonify(command), 202
+
+    @octoprint.plugin.BlueprintPlugin.route("/control/status/<int:command_id>", methods=["GET"])
+    def control_ptz_status(self, command_id):
+        command = self._ptz.get_status(command_id)
+        if not command:
+            return flask.Response("Unknown PTZ command", status=404)
+        return flask.jsonify(command)
 
     # SoftwareUpdatePlugin mixin
     def get_update_information(self):
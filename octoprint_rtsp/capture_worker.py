@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""Out-of-process capture for Streamor.
+
+The worker process runs the normal capture loop (ffmpeg spawn, pipe reading,
+JPEG parsing) and writes every frame into a shared memory block. The OctoPrint
+process only maps the latest frame and republishes it, so none of the parsing
+competes with OctoPrint's serial communication for the GIL.
+
+The worker lives as long as the stream: operating point and profile changes
+are sent to it over a control queue rather than spawning a new one, which
+would start a fresh interpreter and import the plugin package all over.
+"""
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+from .memory import budget
+from .rate_control import OperatingPoint
+from .streamor import Streamor
+
+# generation (u64), then slot index (u32) and frame length (u32)
+_GENERATION = struct.Struct("<Q")
+_SLOT = struct.Struct("<II")
+_HEADER_SIZE = _GENERATION.size + _SLOT.size
+
+
+class SharedFrameBuffer:
+    """Latest-frame exchange through multiprocessing.shared_memory.
+
+    The block holds a header followed by `slots` frame slots. The writer copies
+    a frame into the slot after the current one and then publishes it by
+    bumping the generation counter, seqlock style: odd while the header is
+    being updated, even once it is consistent. Each frame advances the
+    generation by 2, so a reader knows its slot was not reused while copying
+    as long as fewer than `slots` frames were published in the meantime.
+    """
+
+    def __init__(self, shm, slots, slot_size, owner=False):
+        self._shm = shm
+        self.slots = slots
+        self.slot_size = slot_size
+        self._owner = owner
+        self._generation = 0
+        self._slot = 0
+
+    @classmethod
+    def create(cls, slots=3, slot_size=2000000):
+        shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + slots * slot_size)
+        shm.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+        return cls(shm, slots, slot_size, owner=True)
+
+    @classmethod
+    def attach(cls, name, slots, slot_size):
+        return cls(shared_memory.SharedMemory(name=name), slots, slot_size)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def write(self, frame):
+        """Publishes a frame. Frames larger than a slot are dropped."""
+        length = len(frame)
+        if length > self.slot_size:
+            return False
+
+        buf = self._shm.buf
+        slot = (self._slot + 1) % self.slots
+        offset = _HEADER_SIZE + slot * self.slot_size
+        buf[offset:offset + length] = frame
+
+        _GENERATION.pack_into(buf, 0, self._generation + 1)
+        _SLOT.pack_into(buf, _GENERATION.size, slot, length)
+        _GENERATION.pack_into(buf, 0, self._generation + 2)
+        self._generation += 2
+        self._slot = slot
+        return True
+
+    def read(self, last_generation=0):
+        """Returns (generation, frame) for the latest frame, or
+        (last_generation, None) if nothing newer was published."""
+        buf = self._shm.buf
+        while True:
+            generation = _GENERATION.unpack_from(buf, 0)[0]
+            if generation == last_generation or generation == 0:
+                return last_generation, None
+            if generation & 1:
+                time.sleep(0)  # header update in progress
+                continue
+
+            slot, length = _SLOT.unpack_from(buf, _GENERATION.size)
+            if _GENERATION.unpack_from(buf, 0)[0] != generation:
+                continue
+
+            offset = _HEADER_SIZE + slot * self.slot_size
+            frame = bytes(buf[offset:offset + length])
+
+            # The writer fills the slot after the current one, so ours is only
+            # overwritten once `slots - 1` newer frames have been published
+            current = _GENERATION.unpack_from(buf, 0)[0]
+            if (current - generation) // 2 < self.slots - 1:
+                return generation, frame
+
+    def close(self):
+        self._shm.close()
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class _WorkerStreamor(Streamor):
+    """Streamor running inside the worker: frames go to shared memory only."""
+
+    def __init__(self, frames, **kwargs):
+        Streamor.__init__(self, **kwargs)
+        self._frames = frames
+
+    def _publish(self, jpg):
+        return self._frames.write(jpg)
+
+
+def _reconfigure(streamor, update, logger):
+    """Applies settings from Streamor._worker_update() to the worker's streamor."""
+    update["operating_point"] = OperatingPoint(*update["operating_point"])
+    for name, value in update.items():
+        setattr(streamor, name, value)
+    logger.info(f"Streamor: Capture worker reconfigured ({streamor.framerate} fps, "
+                f"resolution {streamor.resolution or 'source'}, "
+                f"operating point {tuple(streamor.operating_point)})")
+    streamor._reconfigure()
+
+
+def _worker_main(shm_name, slots, slot_size, config, control, log_queue):
+    logger = logging.getLogger("octoprint.plugins.rtsp.worker")
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    # Before any capture thread starts, so they and ffmpeg inherit it
+    config["scheduling"].apply_current(whole_process=True)
+
+    parent = os.getppid()
+    frames = SharedFrameBuffer.attach(shm_name, slots, slot_size)
+    streamor = _WorkerStreamor(frames, logger=logger, **config)
+    streamor.start()
+    try:
+        # Settings updates until None asks us to stop
+        while True:
+            try:
+                update = control.get(timeout=1.0)
+            except queue.Empty:
+                # Exit with the parent even if it could not tell us to
+                if os.getppid() != parent:
+                    break
+                continue
+            if update is None:
+                break
+            _reconfigure(streamor, update, logger)
+    finally:
+        streamor.stop()
+        frames.close()
+
+
+class _ForwardHandler(logging.Handler):
+    def __init__(self, logger):
+        logging.Handler.__init__(self)
+        self._target = logger
+
+    def emit(self, record):
+        self._target.handle(record)
+
+
+class CaptureWorker:
+    """Parent-side controller for the capture process.
+
+    Spawns the worker, maps its shared frame buffer and republishes new frames
+    through the owning Streamor's normal publish path.
+    """
+
+    def __init__(self, streamor, slots=3, slot_size=2000000):
+        self.streamor = streamor
+        self.logger = streamor.logger
+        self.slots = slots
+        self.slot_size = slot_size
+
+        self.process = None
+        self.thread = None
+        self._frames = None
+        self._control = None
+        self._log_queue = None
+        self._log_listener = None
+        self._stopping = False
+
+    def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        self._frames = SharedFrameBuffer.create(self.slots, self.slot_size)
+        budget.set((self.streamor._budget_owner, "shm"), self.slots * self.slot_size, "shared_memory")
+        self._control = ctx.Queue()
+
+        log_queue = self._log_queue = ctx.Queue()
+        self._log_listener = logging.handlers.QueueListener(log_queue, _ForwardHandler(self.logger))
+        self._log_listener.start()
+
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(self._frames.name, self.slots, self.slot_size,
+                  self.streamor._worker_config(), self._control, log_queue),
+            name="octoprint-rtsp-capture",
+            daemon=True
+        )
+        self.process.start()
+        # The worker applies the profile to itself; this reports the result
+        self.streamor.apply_scheduling(self.process.pid)
+        self.logger.info(f"Streamor: Capture worker started (pid {self.process.pid})")
+
+        self.thread = threading.Thread(target=self._reader_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def reconfigure(self):
+        """Sends the streamor's current operating point and profile settings
+        to the running worker, which restarts its source with them."""
+        if self._control and not self._stopping:
+            self._control.put(self.streamor._worker_update())
+
+    def stop(self):
+        # Set first - the reader loop must not take this exit for a crash
+        self._stopping = True
+        if self._control:
+            self._control.put(None)
+        if self.process:
+            self.process.join(timeout=3.0)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join(timeout=1.0)
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=1.0)
+        if self._log_listener:
+            self._log_listener.stop()
+        # Their pipes and feeder threads would otherwise outlive the worker
+        for q in (self._control, self._log_queue):
+            if q:
+                q.close()
+                q.join_thread()
+        if self._frames:
+            self._frames.close()
+            budget.release((self.streamor._budget_owner, "shm"))
+
+        self.process = None
+        self.thread = None
+        self._frames = None
+        self._control = None
+        self._log_queue = None
+        self._log_listener = None
+
+    def _reader_loop(self):
+        # Poll at twice the frame rate - reading the header is a 16 byte unpack
+        interval = min(0.05, max(0.005, 0.5 / (self.streamor.framerate or 15)))
+        generation = 0
+        self.streamor._capture_tid = threading.get_native_id() if hasattr(threading, "get_native_id") else None
+
+        while self.streamor.running and not self._stopping and self.process and self.process.is_alive():
+            generation, frame = self._frames.read(generation)
+            if frame:
+                self.streamor._publish(frame)
+            else:
+                time.sleep(interval)
+
+        if self.streamor.running and not self._stopping:
+            self.logger.error("Streamor: Capture worker exited unexpectedly")
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Live pipeline diagnostics for the settings dialog.
+
+While the dialog is open it holds a lease (renewed every few seconds by
+rtsp_plugin.js); DiagnosticsCollector then turns the Streamor counters into
+rates once per second and pushes them as a plugin message. Without a lease
+the thread is not running at all, so closed dialogs cost nothing - and a
+browser that went away without saying so stops the collection when its
+lease runs out.
+"""
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def summarize(before, after, elapsed):
+    """Rates between two Streamor.get_stats() snapshots taken elapsed seconds
+    apart."""
+    elapsed = max(elapsed, 0.001)
+    captured = after["frames_captured"] - before["frames_captured"]
+    published = after["frames_published"] - before["frames_published"]
+    published_bytes = ((after["bytes_captured"] - before["bytes_captured"])
+                       - (after["bytes_suppressed"] - before["bytes_suppressed"])
+                       - (after["bytes_dropped"] - before["bytes_dropped"]))
+    sent = after["client_frames_sent"] - before["client_frames_sent"]
+    latency = after["client_latency_total"] - before["client_latency_total"]
+    viewers = after["clients"]
+    pacing = after.get("pacing")
+
+    return dict(
+        capture_fps=round(captured / elapsed, 1),
+        published_fps=round(published / elapsed, 1),
+        # Per viewer - what a client actually gets to see
+        delivered_fps=round(sent / elapsed / viewers, 1) if viewers else None,
+        avg_frame_kb=round((after["bytes_captured"] - before["bytes_captured"]) / captured / 1024, 1) if captured else None,
+        bitrate_kbps=round(published_bytes * 8 / elapsed / 1000, 1),
+        viewers=viewers,
+        # Capture to socket write, averaged over the frames sent
+        latency_ms=round(latency / sent * 1000, 1) if sent else None,
+        restarts=after.get("restarts", 0),
+        operating_point=after.get("operating_point"),
+        profile=after.get("profile"),
+        # Between frames, as captured and as released by the pacer
+        jitter_in_ms=pacing["jitter_in_ms"] if pacing else None,
+        jitter_out_ms=pacing["jitter_out_ms"] if pacing else None,
+    )
+
+
+class DiagnosticsCollector:
+    def __init__(self, get_streamor, send, interval=1.0, lease=30.0):
+        self._get_streamor = get_streamor
+        self._send = send
+        self.interval = interval
+        self.lease = lease
+
+        self._lock = threading.Lock()
+        self._expires = 0
+        self._thread = None
+        self._processes = {}
+
+    @property
+    def active(self):
+        return self._thread is not None
+
+    def renew(self):
+        """Starts collecting (or extends the lease) for the next lease seconds."""
+        with self._lock:
+            self._expires = time.monotonic() + self.lease
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="octoprint-rtsp-diagnostics")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._expires = 0
+
+    def _loop(self):
+        previous = None
+        try:
+            while True:
+                with self._lock:
+                    if time.monotonic() >= self._expires:
+                        self._thread = None
+                        return
+
+                streamor = self._get_streamor()
+                if streamor and streamor.running:
+                    now = time.monotonic()
+                    stats = streamor.get_stats()
+                    if previous and previous[0] is streamor:
+                        sample = summarize(previous[2], stats, now - previous[1])
+                        sample["ffmpeg_cpu"] = self._cpu_percent(streamor._capture_pids())
+                        self._send(sample)
+                    previous = (streamor, now, stats)
+                else:
+                    previous = None
+                    self._send(dict(running=False))
+
+                time.sleep(self.interval)
+        finally:
+            self._processes = {}
+
+    def _cpu_percent(self, pids):
+        """CPU of the capture processes (and their children) since the last
+        call, in percent of one core."""
+        if psutil is None:
+            return None
+        total = 0.0
+        seen = {}
+        for pid in pids:
+            try:
+                parent = psutil.Process(pid)
+                for process in [parent] + parent.children(recursive=True):
+                    # Reuse Process objects - cpu_percent() measures since the previous call
+                    process = self._processes.get(process.pid, process)
+                    seen[process.pid] = process
+                    total += process.cpu_percent(None)
+            except (psutil.Error, TypeError, ValueError):
+                continue
+        self._processes = seen
+        return round(total, 1)
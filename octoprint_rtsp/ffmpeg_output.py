@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Parsing of ffmpeg's -progress output and filtering of its stderr log."""
+import logging
+import re
+import time
+
+
+def _number(value, suffix=""):
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None  # "N/A" while ffmpeg is still negotiating
+
+
+# Keys of a -progress block we turn into stats, with their converters
+_PROGRESS_KEYS = {
+    "frame": ("frames", lambda v: _number(v)),
+    "fps": ("fps", lambda v: _number(v)),
+    "bitrate": ("bitrate_kbps", lambda v: _number(v, "kbits/s")),
+    "speed": ("speed", lambda v: _number(v, "x")),
+    "dup_frames": ("dup_frames", lambda v: _number(v)),
+    "drop_frames": ("drop_frames", lambda v: _number(v)),
+    "total_size": ("total_size", lambda v: _number(v)),
+    "out_time_us": ("out_time", lambda v: (_number(v) or 0) / 1000000.0),
+}
+
+_INTEGER_STATS = ("frames", "dup_frames", "drop_frames", "total_size")
+
+
+class ProgressParser:
+    """Accumulates `key=value` lines from `-progress` into stat snapshots.
+
+    ffmpeg writes one block per update, terminated by `progress=continue` (or
+    `progress=end`). feed() returns the parsed block when it completes.
+    """
+
+    def __init__(self):
+        self._block = {}
+
+    def feed(self, line):
+        key, sep, value = line.partition("=")
+        if not sep:
+            return None
+
+        key = key.strip()
+        if key == "progress":
+            block, self._block = self._block, {}
+            block["state"] = value.strip()
+            block["updated"] = time.time()
+            return block
+
+        if key in _PROGRESS_KEYS:
+            name, convert = _PROGRESS_KEYS[key]
+            parsed = convert(value)
+            if parsed is not None and name in _INTEGER_STATS:
+                parsed = int(parsed)
+            self._block[name] = parsed
+        return None
+
+
+_ERROR_PATTERN = re.compile(
+    r"error|fail|invalid|unable|could not|cannot|refused|timed out|not found|no such|denied",
+    re.IGNORECASE
+)
+# "-loglevel level+warning" tags each line, e.g. "[rtsp @ 0x55d1] [error] ..."
+_LEVEL_PATTERN = re.compile(r"\[(panic|fatal|error|warning)\]")
+_ADDRESS_PATTERN = re.compile(r"@ 0x[0-9a-f]+")
+_NUMBER_PATTERN = re.compile(r"\d+")
+
+
+class FfmpegLogFilter:
+    """Classifies ffmpeg stderr lines and keeps them from flooding the log.
+
+    Lines are logged as WARNING or ERROR. Repeats of the same message (ignoring
+    numbers and context addresses) are collapsed into a single "repeated N
+    times" note per window, and at most `max_lines` distinct lines are logged
+    per window.
+    """
+
+    def __init__(self, logger, window=60.0, max_lines=20):
+        self.logger = logger
+        self.window = window
+        self.max_lines = max_lines
+
+        self.counts = dict(warnings=0, errors=0, suppressed=0)
+        self._seen = {}  # key -> [last logged time, repeats since]
+        self._window_start = 0
+        self._window_lines = 0
+        self._window_dropped = 0
+
+    def classify(self, line):
+        tag = _LEVEL_PATTERN.search(line)
+        if tag:
+            return logging.WARNING if tag.group(1) == "warning" else logging.ERROR
+        # Untagged output (ffmpeg < 4.4): go by wording
+        return logging.ERROR if _ERROR_PATTERN.search(line) else logging.WARNING
+
+    def _key(self, line):
+        return _NUMBER_PATTERN.sub("#", _ADDRESS_PATTERN.sub("", line))
+
+    def handle(self, line, now=None):
+        """Logs the line if it isn't a recent duplicate or over the rate limit.
+        Returns True if the line was logged."""
+        if not line:
+            return False
+
+        now = now if now is not None else time.time()
+        level = self.classify(line)
+        self.counts["errors" if level == logging.ERROR else "warnings"] += 1
+
+        if now - self._window_start >= self.window:
+            if self._window_dropped:
+                self.logger.warning(f"FFmpeg: {self._window_dropped} further messages suppressed")
+            self._window_start = now
+            self._window_lines = 0
+            self._window_dropped = 0
+            # Forget messages that went quiet so the table stays small
+            self._seen = {k: v for k, v in self._seen.items()
+                          if v[1] or now - v[0] < self.window}
+
+        key = self._key(line)
+        seen = self._seen.get(key)
+        if seen and now - seen[0] < self.window:
+            seen[1] += 1
+            self.counts["suppressed"] += 1
+            return False
+
+        if self._window_lines >= self.max_lines:
+            self._window_dropped += 1
+            self.counts["suppressed"] += 1
+            return False
+
+        repeats = seen[1] if seen else 0
+        self._seen[key] = [now, 0]
+        self._window_lines += 1
+
+        if repeats:
+            line = f"{line} (repeated {repeats} times)"
+        self.logger.log(level, f"FFmpeg: {line}")
+        return True
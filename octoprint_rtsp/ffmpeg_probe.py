@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""One-time probe of the installed ffmpeg's version and capabilities.
+
+Option names change between ffmpeg releases (e.g. the RTSP socket timeout
+`-stimeout` became `-timeout` in 5.0), so the command builder asks the probe
+instead of assuming. Results are cached in memory and on disk, keyed by the
+binary's resolved path, mtime and size, so startup only re-probes after
+ffmpeg was replaced.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+CACHE_FILE = "ffmpeg_capabilities.json"
+
+# "-fps_mode[:<stream_spec>] <mode>" in newer builds
+_OPTION_PATTERN = re.compile(r"^\s*-([A-Za-z0-9_:]+)(?:\[[^\]]*\])?\s")
+_VERSION_PATTERN = re.compile(r"version\s+n?(\d+)\.(\d+)")
+
+_memory_cache = {}
+_memory_lock = threading.Lock()
+
+
+class FfmpegCapabilities:
+    def __init__(self, path, version="", options=(), muxers=(), encoders=(), decoders=()):
+        self.path = path
+        self.version = version
+        self.options = set(options)
+        self.muxers = set(muxers)
+        self.encoders = set(encoders)
+        self.decoders = set(decoders)
+
+    @property
+    def version_tuple(self):
+        """(major, minor), or None for git snapshots like "N-112233-gabc"."""
+        match = _VERSION_PATTERN.search(self.version)
+        return (int(match.group(1)), int(match.group(2))) if match else None
+
+    def has_option(self, name):
+        return name in self.options
+
+    def supports_log_level_prefix(self):
+        # "-loglevel level+warning" prefixes lines with [warning]/[error], added in 4.4
+        version = self.version_tuple
+        return version is None or version >= (4, 4)
+
+    def to_dict(self):
+        return dict(
+            path=self.path,
+            version=self.version,
+            options=sorted(self.options),
+            muxers=sorted(self.muxers),
+            encoders=sorted(self.encoders),
+            decoders=sorted(self.decoders),
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["path"], data.get("version", ""), data.get("options", ()),
+                   data.get("muxers", ()), data.get("encoders", ()), data.get("decoders", ()))
+
+
+def _run(path, *args):
+    result = subprocess.run([path, "-hide_banner"] + list(args),
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            timeout=15)
+    return result.stdout.decode("utf-8", errors="ignore")
+
+
+def _parse_table(output):
+    """Names from the -muxers/-encoders/-decoders listings ("flags name description"
+    rows after the "--" separator line)."""
+    names = set()
+    started = False
+    for line in output.splitlines():
+        if not started:
+            started = line.strip().startswith("--")
+            continue
+        parts = line.split()
+        if len(parts) >= 2:
+            # -muxers/-formats list "a,b" aliases in one column
+            names.update(parts[1].split(","))
+    return names
+
+
+def _probe(path):
+    version = _run(path, "-version").splitlines()
+    options = set()
+    for line in _run(path, "-h", "full").splitlines():
+        match = _OPTION_PATTERN.match(line)
+        if match:
+            options.add(match.group(1))
+
+    return FfmpegCapabilities(
+        path,
+        version=version[0] if version else "",
+        options=options,
+        muxers=_parse_table(_run(path, "-muxers")),
+        encoders=_parse_table(_run(path, "-encoders")),
+        decoders=_parse_table(_run(path, "-decoders")),
+    )
+
+
+def probe_ffmpeg(binary="ffmpeg", cache_dir=None, logger=None):
+    """Returns FfmpegCapabilities for the binary, or None if it can't be found
+    or run."""
+    logger = logger or logging.getLogger(__name__)
+
+    path = shutil.which(binary)
+    if not path:
+        return None
+    path = os.path.realpath(path)
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = f"{path}:{st.st_mtime_ns}:{st.st_size}"
+
+    with _memory_lock:
+        if key in _memory_cache:
+            return _memory_cache[key]
+
+        cache_path = os.path.join(cache_dir, CACHE_FILE) if cache_dir else None
+        caps = None
+        if cache_path:
+            try:
+                with open(cache_path) as f:
+                    cached = json.load(f)
+                if cached.get("key") == key:
+                    caps = FfmpegCapabilities.from_dict(cached["capabilities"])
+            except (OSError, ValueError, KeyError):
+                pass
+
+        if caps is None:
+            try:
+                caps = _probe(path)
+            except Exception as e:
+                logger.error(f"Streamor: Probing {path} failed: {e}")
+                return None
+            logger.info(f"Streamor: Probed {caps.version or path} "
+                        f"({len(caps.options)} options, {len(caps.encoders)} encoders)")
+
+            if cache_path:
+                try:
+                    tmp_path = cache_path + ".tmp"
+                    with open(tmp_path, "w") as f:
+                        json.dump(dict(key=key, capabilities=caps.to_dict()), f)
+                    os.replace(tmp_path, cache_path)
+                except OSError as e:
+                    logger.warning(f"Streamor: Could not cache ffmpeg capabilities: {e}")
+
+        _memory_cache[key] = caps
+        return caps
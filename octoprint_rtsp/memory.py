@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Global memory budget for frame data.
+
+Everything that holds frames - the live frame of every Streamor, JPEG parser
+buffers, the capture worker's shared memory, the shared multipart part sent
+to stream clients, poster frames - is accounted in one process wide budget.
+
+Entries are either required (the pipeline can't work without them) or
+optional, i.e. caches that can be rebuilt. Optional entries come with a drop
+callback; when an update would exceed the limit the least recently updated
+optional entries are dropped first. Required entries are always accepted, so
+a limit that is too small degrades to "no caches" rather than "no video".
+
+Drop callbacks run without the budget lock held and must only clear a
+reference - they can be called from any thread.
+"""
+import collections
+import threading
+
+DEFAULT_LIMIT = 64 * 1024 * 1024
+
+
+class MemoryBudget:
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        self.usage = 0
+        self.high_water = 0
+        self.evictions = 0
+        self.rejections = 0
+        self._lock = threading.Lock()
+        # key -> (size, category, drop callback or None), least recent first
+        self._entries = collections.OrderedDict()
+
+    def set(self, key, size, category, drop=None):
+        """Accounts size bytes for key, replacing what it held before. With a
+        drop callback the entry is optional: returns False (and accounts
+        nothing) if it doesn't fit even after dropping older optional entries,
+        in which case the caller must not keep the data."""
+        victims = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self.usage -= previous[0]
+
+            if self.usage + size > self.limit:
+                for victim, (victim_size, _, victim_drop) in list(self._entries.items()):
+                    if self.usage + size <= self.limit:
+                        break
+                    if victim_drop is None:
+                        continue
+                    del self._entries[victim]
+                    self.usage -= victim_size
+                    self.evictions += 1
+                    victims.append(victim_drop)
+
+            accepted = drop is None or self.usage + size <= self.limit
+            if accepted:
+                self._entries[key] = (size, category, drop)
+                self.usage += size
+                self.high_water = max(self.high_water, self.usage)
+            else:
+                self.rejections += 1
+
+        for victim_drop in victims:
+            victim_drop()
+        return accepted
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self.usage -= entry[0]
+
+    def release_owner(self, owner):
+        """Releases all entries whose key is (owner, ...)."""
+        with self._lock:
+            for key in [k for k in self._entries if isinstance(k, tuple) and k[0] == owner]:
+                self.usage -= self._entries.pop(key)[0]
+
+    def get_stats(self):
+        with self._lock:
+            categories = {}
+            for size, category, _ in self._entries.values():
+                categories[category] = categories.get(category, 0) + size
+            return dict(
+                limit=self.limit,
+                usage=self.usage,
+                high_water=self.high_water,
+                evictions=self.evictions,
+                rejections=self.rejections,
+                categories=categories,
+            )
+
+
+# Shared by every Streamor (and so every camera) in the process
+budget = MemoryBudget()
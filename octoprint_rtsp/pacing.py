@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Frame pacing between capture and publish.
+
+Cameras on Wi-Fi deliver frames in bursts: several within a few milliseconds,
+then nothing for a while. Published as they arrive, every viewer is woken
+several times in a row and then sees a freeze. The pacer holds the latest
+captured frame and releases it on a steady clock at the target frame rate.
+
+It never queues: a frame arriving while another one waits replaces it (the
+waiting one is dropped), so pacing never builds up delay. A frame is never
+held longer than max_latency - if the clock's next tick is further away the
+frame goes out early and the clock is re-phased to it.
+
+Jitter (standard deviation of the intervals between frames) is measured on
+the captured and on the released frames, so the effect is visible in the
+stats.
+"""
+import collections
+import statistics
+import threading
+import time
+
+# Intervals the jitter is computed over
+WINDOW = 100
+
+
+def _jitter_ms(intervals):
+    return round(statistics.pstdev(intervals) * 1000, 1) if len(intervals) > 1 else None
+
+
+class FramePacer:
+    def __init__(self, release, framerate, max_latency=0.1):
+        """release(frame, captured) is called from the pacer thread for every
+        frame let through, captured being its time.time() arrival. framerate
+        is a callable returning the current target rate."""
+        self._release = release
+        self._framerate = framerate
+        self.max_latency = max_latency
+
+        self._condition = threading.Condition()
+        self._pending = None  # (frame, monotonic arrival, wall clock arrival)
+        self._next_release = 0
+        self._running = False
+        self._thread = None
+
+        self._last_in = None
+        self._last_out = None
+        self._intervals_in = collections.deque(maxlen=WINDOW)
+        self._intervals_out = collections.deque(maxlen=WINDOW)
+        self.frames_in = 0
+        self.frames_out = 0
+        self.frames_dropped = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._loop, name="octoprint-rtsp-pacer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._pending = None
+            self._condition.notify()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def submit(self, frame):
+        """Hands over a captured frame. Returns the frame it replaced (which
+        is dropped) or None."""
+        now = time.monotonic()
+        with self._condition:
+            if self._last_in is not None:
+                self._intervals_in.append(now - self._last_in)
+            self._last_in = now
+            self.frames_in += 1
+
+            dropped = self._pending[0] if self._pending else None
+            if dropped is not None:
+                self.frames_dropped += 1
+            self._pending = (frame, now, time.time())
+            self._condition.notify()
+        return dropped
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while self._running and self._pending is None:
+                    self._condition.wait()
+                if not self._running:
+                    return
+
+                frame, arrived, captured = self._pending
+                framerate = self._framerate()
+                interval = 1.0 / framerate if framerate else 0.0
+                # On the clock, but never before the frame arrived nor longer
+                # than max_latency after
+                due = min(max(self._next_release, arrived), arrived + self.max_latency)
+                now = time.monotonic()
+                if now < due:
+                    self._condition.wait(due - now)
+                    continue
+
+                self._pending = None
+                # Steady clock from the planned release; after a stall start
+                # afresh instead of catching up
+                self._next_release = due + interval if now - due < interval else now + interval
+
+                if self._last_out is not None:
+                    self._intervals_out.append(now - self._last_out)
+                self._last_out = now
+                self.frames_out += 1
+                self._latency_total += now - arrived
+                self._latency_max = max(self._latency_max, now - arrived)
+
+            self._release(frame, captured)
+
+    def get_stats(self):
+        with self._condition:
+            return dict(
+                framerate=self._framerate(),
+                max_latency_ms=round(self.max_latency * 1000),
+                frames_in=self.frames_in,
+                frames_out=self.frames_out,
+                frames_dropped=self.frames_dropped,
+                jitter_in_ms=_jitter_ms(self._intervals_in),
+                jitter_out_ms=_jitter_ms(self._intervals_out),
+                latency_avg_ms=round(self._latency_total / self.frames_out * 1000, 1) if self.frames_out else None,
+                latency_max_ms=round(self._latency_max * 1000, 1),
+            )
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Capture profiles and the CPU accounting behind them.
+
+The "idle" profile is the configured stream settings. RtspPlugin switches to
+the "printing" profile (lower frame rate, smaller resolution, keyframe-only
+decoding) while a print is running, so transcoding doesn't starve the serial
+connection on small boards. Streamor tracks how much CPU the capture pipeline
+used in each profile, which is what /stats reports as CPU saved.
+"""
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+IDLE = "idle"
+PRINTING = "printing"
+
+
+class PipelineCpuMeter:
+    """Cumulative CPU seconds used by the capture pipeline.
+
+    Covers the capture thread inside OctoPrint plus the capture processes
+    (ffmpeg, or the capture worker and its children). Usage is summed from the
+    deltas between samples, so restarted processes keep counting.
+    """
+
+    def __init__(self):
+        self.total = 0.0
+        self._last = {}
+
+    @classmethod
+    def available(cls):
+        return psutil is not None
+
+    def sample(self, pids=(), thread_id=None):
+        current = {}
+        if thread_id is not None:
+            try:
+                for thread in psutil.Process().threads():
+                    if thread.id == thread_id:
+                        current[("thread", thread_id)] = thread.user_time + thread.system_time
+            except psutil.Error:
+                pass
+
+        for pid in pids:
+            try:
+                parent = psutil.Process(pid)
+                processes = [parent] + parent.children(recursive=True)
+            except (psutil.Error, TypeError, ValueError):
+                continue  # exited, or not a usable pid
+            for process in processes:
+                try:
+                    times = process.cpu_times()
+                    # create_time tells a reused pid from the process we saw before
+                    current[("process", process.pid, process.create_time())] = times.user + times.system
+                except psutil.Error:
+                    pass
+
+        for key, seconds in current.items():
+            self.total += max(0.0, seconds - self._last.get(key, 0.0))
+        self._last = current
+        return self.total
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Non-blocking PTZ command client.
+
+Button presses are queued and sent from a background thread, so the HTTP
+request that triggered them returns immediately. Connections are kept alive
+per camera host, and repeated presses of a direction that is still waiting
+in the queue are coalesced into the pending command.
+"""
+import base64
+import collections
+import http.client
+import logging
+import threading
+import time
+import urllib.parse
+
+
+class PtzQueueFull(Exception):
+    pass
+
+
+class PtzClient:
+    def __init__(self, logger=None, max_pending=8, timeout=5, history=32):
+        self.logger = logger or logging.getLogger(__name__)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.history = history
+
+        self._condition = threading.Condition()
+        self._pending = collections.deque()        # commands waiting to be sent
+        self._commands = collections.OrderedDict() # id -> command, for status lookups
+        self._connections = {}                     # (scheme, host, port) -> connection
+        self._next_id = 1
+        self._thread = None
+        self._running = False
+
+    def submit(self, direction, url):
+        """Queues a command and returns its status dict.
+
+        If the same URL is already waiting to be sent, the press is folded into
+        that command instead. Raises PtzQueueFull when too many are pending.
+        """
+        with self._condition:
+            for command in self._pending:
+                if command["url"] == url:
+                    command["coalesced"] += 1
+                    return self._public(command)
+
+            if len(self._pending) >= self.max_pending:
+                raise PtzQueueFull()
+
+            command = dict(
+                id=self._next_id,
+                direction=direction,
+                url=url,
+                status="queued",
+                coalesced=0,
+                error=None,
+                created=time.time(),
+                finished=None,
+            )
+            self._next_id += 1
+            self._pending.append(command)
+            self._commands[command["id"]] = command
+            while len(self._commands) > self.history:
+                self._commands.popitem(last=False)
+
+            self._ensure_worker()
+            self._condition.notify()
+            return self._public(command)
+
+    def get_status(self, command_id):
+        with self._condition:
+            command = self._commands.get(command_id)
+            return self._public(command) if command else None
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=self.timeout + 1)
+        self._thread = None
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+    def _public(self, command):
+        # Never hand out the URL - it usually carries camera credentials
+        return {k: v for k, v in command.items() if k != "url"}
+
+    def _ensure_worker(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._worker_loop, name="octoprint-rtsp-ptz")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                command = self._pending.popleft()
+                command["status"] = "sending"
+
+            try:
+                self._send(command["url"])
+                status, error = "done", None
+            except Exception as e:
+                self.logger.error(f"PTZ Error ({command['direction']}): {e}")
+                status, error = "failed", str(e)
+
+            with self._condition:
+                command["status"] = status
+                command["error"] = error
+                command["finished"] = time.time()
+
+    def _send(self, url):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported PTZ URL scheme: {parts.scheme}")
+
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        headers = {}
+        if parts.username:
+            credentials = f"{urllib.parse.unquote(parts.username)}:{urllib.parse.unquote(parts.password or '')}"
+            headers["Authorization"] = "Basic " + base64.b64encode(credentials.encode()).decode()
+
+        # A pooled connection may have been closed by the camera in the meantime,
+        # so a failure on a reused connection gets one retry on a fresh one
+        for attempt in range(2):
+            reused = key in self._connections
+            connection = self._connections.get(key) or self._connect(parts)
+            self._connections[key] = connection
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (ConnectionError, http.client.BadStatusLine, http.client.CannotSendRequest):
+                self._drop_connection(key)
+                if not reused or attempt:
+                    raise
+                continue
+            except Exception:
+                self._drop_connection(key)
+                raise
+
+            if response.will_close:
+                self._drop_connection(key)
+            if response.status >= 400:
+                raise http.client.HTTPException(f"HTTP {response.status} {response.reason}")
+            return
+
+    def _connect(self, parts):
+        if parts.scheme == "https":
+            return http.client.HTTPSConnection(parts.hostname, parts.port, timeout=self.timeout)
+        return http.client.HTTPConnection(parts.hostname, parts.port, timeout=self.timeout)
+
+    def _drop_connection(self, key):
+        connection = self._connections.pop(key, None)
+        if connection:
+            connection.close()
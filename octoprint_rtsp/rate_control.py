@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Closed-loop quality and rate control for the capture pipeline.
+
+QualityController samples three pressure signals every few seconds:
+
+    lag        ffmpeg's -progress speed below real time (or, for backends
+               without progress output, fewer frames captured than requested)
+    cpu        host CPU utilisation
+    delivery   share of published frames the stream clients actually received
+               (a client that can't keep up skips frames)
+
+and moves the Streamor along a ladder of operating points - MJPEG quality,
+frame rate and output scale - one step at a time. Stepping down needs a few
+consecutive pressured samples, stepping up a longer run of samples with
+headroom plus a hold time since the last change. A step down shortly after a
+step up doubles that hold time, so a pipeline sitting on the edge settles
+instead of restarting ffmpeg every minute.
+"""
+import collections
+import os
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# quality is the MJPEG -q:v (2 best ... 31 worst), scale applies to the output size
+OperatingPoint = collections.namedtuple("OperatingPoint", "quality framerate scale")
+
+DEFAULT_QUALITY = 5
+
+
+def build_ladder(framerate, quality=DEFAULT_QUALITY):
+    """Operating points from the configured one (index 0) down to the floor."""
+    framerate = framerate or 15
+    ladder = [
+        OperatingPoint(quality, framerate, 1.0),
+        OperatingPoint(quality + 3, framerate, 1.0),
+        OperatingPoint(quality + 6, max(1, round(framerate * 2 / 3)), 1.0),
+        OperatingPoint(quality + 9, max(1, framerate // 2), 0.75),
+        OperatingPoint(quality + 13, max(1, framerate // 3), 0.5),
+    ]
+    # Low configured frame rates collapse some steps - drop the duplicates
+    unique = []
+    for point in ladder:
+        if point not in unique:
+            unique.append(point)
+    return unique
+
+
+def host_cpu_percent():
+    """System wide CPU utilisation since the previous call, in percent."""
+    if psutil is not None:
+        return psutil.cpu_percent(interval=None)
+    try:
+        return os.getloadavg()[0] * 100.0 / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+class QualityController:
+    def __init__(self, streamor, interval=5.0, cpu_high=85.0, cpu_low=60.0,
+                 min_speed=0.95, min_fps_ratio=0.8, min_delivery=0.8,
+                 down_after=2, up_after=6, hold=30.0, max_hold=600.0,
+                 cpu_percent=host_cpu_percent):
+        self.streamor = streamor
+        self.logger = streamor.logger
+        self.interval = interval
+        self.cpu_high = cpu_high
+        self.cpu_low = cpu_low
+        self.min_speed = min_speed
+        self.min_fps_ratio = min_fps_ratio
+        self.min_delivery = min_delivery
+        self.down_after = down_after
+        self.up_after = up_after
+        self.base_hold = hold
+        self.max_hold = max_hold
+        self._cpu_percent = cpu_percent
+
+        self.ladder = build_ladder(streamor.framerate)
+        self.level = 0
+        self.hold = hold
+        self.changes = 0
+        self.reason = None
+        self.signals = {}
+
+        self._pressure_ticks = 0
+        self._headroom_ticks = 0
+        self._last_change = 0
+        self._last_step_up = None
+        self._last_sample = None
+
+        self.running = False
+        self._thread = None
+        self._wake = threading.Event()
+
+    @property
+    def operating_point(self):
+        return self.ladder[self.level]
+
+    def rebase(self, framerate):
+        """Rebuilds the ladder for a new configured frame rate (profile
+        switch), keeping the current level."""
+        self.ladder = build_ladder(framerate)
+        self.level = min(self.level, len(self.ladder) - 1)
+        self._last_sample = None
+        return self.operating_point
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._wake.clear()
+        self._last_change = time.monotonic()
+        if self._cpu_percent:
+            self._cpu_percent()  # prime psutil's interval measurement
+        self._thread = threading.Thread(target=self._loop, name="octoprint-rtsp-quality")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def _loop(self):
+        while self.running and not self._wake.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                self.logger.error(f"Streamor: Quality controller error: {e}")
+
+    def tick(self, now=None):
+        """Takes a sample and steps the operating point if needed."""
+        now = time.monotonic() if now is None else now
+        signals = self.sample(now)
+        if signals is not None:
+            self.update(signals, now)
+
+    def sample(self, now):
+        """Returns this interval's signals, or None on the first call."""
+        stats = self.streamor.get_stats()
+        previous, self._last_sample = self._last_sample, (now, stats)
+        if previous is None:
+            return None
+
+        then, before = previous
+        elapsed = max(0.001, now - then)
+        point = self.operating_point
+
+        captured_fps = (stats["frames_captured"] - before["frames_captured"]) / elapsed
+        sent = stats["client_frames_sent"] - before["client_frames_sent"]
+        skipped = stats["client_frames_skipped"] - before["client_frames_skipped"]
+        speed = stats.get("ffmpeg", {}).get("speed")
+
+        return dict(
+            cpu=self._cpu_percent() if self._cpu_percent else None,
+            speed=speed,
+            capture_fps=round(captured_fps, 2),
+            fps_ratio=round(captured_fps / point.framerate, 3) if point.framerate else None,
+            delivery=round(sent / (sent + skipped), 3) if sent + skipped else None,
+            client_throughput=int((stats["client_bytes_sent"] - before["client_bytes_sent"]) / elapsed),
+        )
+
+    def _pressure(self, signals):
+        reasons = []
+        if signals["cpu"] is not None and signals["cpu"] >= self.cpu_high:
+            reasons.append(f"cpu {signals['cpu']:.0f}%")
+        if signals["speed"] is not None:
+            # ffmpeg reports its own speed - a slow camera doesn't look like lag
+            if signals["speed"] < self.min_speed:
+                reasons.append(f"ffmpeg speed {signals['speed']:.2f}x")
+        elif signals["fps_ratio"] is not None and signals["fps_ratio"] < self.min_fps_ratio:
+            reasons.append(f"capturing {signals['capture_fps']:.1f} fps")
+        if signals["delivery"] is not None and signals["delivery"] < self.min_delivery:
+            reasons.append(f"clients received {signals['delivery'] * 100:.0f}% of frames")
+        return reasons
+
+    def _headroom(self, signals):
+        if signals["cpu"] is not None and signals["cpu"] > self.cpu_low:
+            return False
+        if signals["delivery"] is not None and signals["delivery"] < 0.95:
+            return False
+        return True
+
+    def update(self, signals, now):
+        """Feeds one sample into the controller. Returns the new level if it
+        changed, otherwise None."""
+        self.signals = signals
+        pressure = self._pressure(signals)
+
+        if pressure:
+            self._pressure_ticks += 1
+            self._headroom_ticks = 0
+            if self._pressure_ticks >= self.down_after and self.level < len(self.ladder) - 1:
+                if self._last_step_up is not None and now - self._last_step_up < self.hold:
+                    # Stepped up into trouble - wait longer before trying again
+                    self.hold = min(self.hold * 2, self.max_hold)
+                return self._set_level(self.level + 1, ", ".join(pressure), now)
+        elif self._headroom(signals):
+            self._headroom_ticks += 1
+            self._pressure_ticks = 0
+            if self.level == 0 and now - self._last_change >= self.hold:
+                self.hold = self.base_hold  # settled at the top again
+            if (self._headroom_ticks >= self.up_after and self.level > 0
+                    and now - self._last_change >= self.hold):
+                self._last_step_up = now
+                return self._set_level(self.level - 1, "headroom", now)
+        else:
+            self._pressure_ticks = 0
+            self._headroom_ticks = 0
+        return None
+
+    def _set_level(self, level, reason, now):
+        self.level = level
+        self.reason = reason
+        self.changes += 1
+        self._last_change = now
+        self._pressure_ticks = 0
+        self._headroom_ticks = 0
+        # The restart disturbs the next interval's numbers - start sampling afresh
+        self._last_sample = None
+
+        point = self.operating_point
+        self.logger.info(f"Streamor: Operating point {level} (q{point.quality}, "
+                         f"{point.framerate} fps, scale {point.scale}) - {reason}")
+        self.streamor.set_operating_point(point)
+        return level
+
+    def get_state(self):
+        return dict(
+            level=self.level,
+            levels=len(self.ladder),
+            operating_point=self.operating_point._asdict(),
+            reason=self.reason,
+            changes=self.changes,
+            hold=self.hold,
+            signals=dict(self.signals),
+        )
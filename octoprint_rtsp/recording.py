@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Recording of captured frames for deterministic replay.
+
+A recording is a compact binary file: an 8 byte magic and a version, then
+one record per frame holding the arrival time (microseconds since the
+recording started), the frame length and the JPEG bytes. ReplayBackend
+(see backends.py) feeds a recording back through the normal publish path.
+"""
+import struct
+import threading
+import time
+
+MAGIC = b"ORTSPREC"
+VERSION = 1
+
+_FILE_HEADER = struct.Struct("<8sH")
+_RECORD_HEADER = struct.Struct("<QI")  # timestamp (us), frame length
+
+
+class RecordingError(Exception):
+    pass
+
+
+class FrameRecorder:
+    """Appends frames with their arrival times to a recording file.
+
+    Stops by itself once max_bytes or max_duration (seconds) is exceeded, so
+    a forgotten recording can't fill the SD card.
+    """
+
+    def __init__(self, path, max_bytes=100 * 1024 * 1024, max_duration=600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_duration = max_duration
+
+        self.frames = 0
+        self.bytes_written = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(path, "wb")
+        self._file.write(_FILE_HEADER.pack(MAGIC, VERSION))
+
+    @property
+    def active(self):
+        return self._file is not None
+
+    def write(self, frame, now=None):
+        """Records a frame. Returns False once the recorder is closed."""
+        with self._lock:
+            if self._file is None:
+                return False
+
+            elapsed = (now if now is not None else time.monotonic()) - self.started
+            self._file.write(_RECORD_HEADER.pack(int(elapsed * 1000000), len(frame)))
+            self._file.write(frame)
+            self.frames += 1
+            self.bytes_written += _RECORD_HEADER.size + len(frame)
+
+            if self.bytes_written >= self.max_bytes or elapsed >= self.max_duration:
+                self._close()
+            return True
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def info(self):
+        return dict(
+            path=self.path,
+            active=self.active,
+            frames=self.frames,
+            bytes=self.bytes_written,
+            duration=time.monotonic() - self.started,
+        )
+
+
+def read_recording(path):
+    """Yields (timestamp in seconds, frame) from a recording file."""
+    with open(path, "rb") as f:
+        header = f.read(_FILE_HEADER.size)
+        if len(header) < _FILE_HEADER.size:
+            raise RecordingError(f"{path} is not a recording")
+        magic, version = _FILE_HEADER.unpack(header)
+        if magic != MAGIC:
+            raise RecordingError(f"{path} is not a recording")
+        if version != VERSION:
+            raise RecordingError(f"Unsupported recording version {version}")
+
+        while True:
+            record = f.read(_RECORD_HEADER.size)
+            if len(record) < _RECORD_HEADER.size:
+                return  # end of file (or truncated by a crash mid-write)
+            timestamp, length = _RECORD_HEADER.unpack(record)
+            frame = f.read(length)
+            if len(frame) < length:
+                return
+            yield timestamp / 1000000.0, frame
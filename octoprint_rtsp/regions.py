@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Named regions of interest ("nozzle", "bed", ...) of a camera.
+
+A region is a rectangle in percent of the (flipped/rotated) frame, so it
+stays put whatever the resolution. FfmpegBackend crops every region from the
+same decode - the filter graph splits the decoded frame once per region - and
+encodes each crop as its own MJPEG output, served at /stream?roi=<name>.
+"""
+import collections
+import re
+
+Region = collections.namedtuple("Region", "x y width height")
+
+_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def parse_region(spec):
+    """Region from "x,y,width,height" in percent. Raises ValueError."""
+    try:
+        region = Region(*(float(value) for value in spec.split(",")))
+    except TypeError:
+        raise ValueError(f"expected x,y,width,height, got '{spec}'")
+    if region.width <= 0 or region.height <= 0 or region.x < 0 or region.y < 0 \
+            or region.x + region.width > 100 or region.y + region.height > 100:
+        raise ValueError(f"'{spec}' is not inside the frame (0-100%)")
+    return region
+
+
+def parse_regions(text):
+    """Regions from one "name = x,y,width,height" per line (or separated by
+    ";"). Returns (regions by name, list of errors for the lines skipped)."""
+    regions = {}
+    errors = []
+    for line in re.split(r"[;\n]", text or ""):
+        line = line.strip()
+        if not line:
+            continue
+        name, separator, spec = line.partition("=")
+        name = name.strip()
+        if not separator or not _NAME.match(name):
+            errors.append(f"invalid region '{line}', expected name = x,y,width,height")
+            continue
+        try:
+            regions[name] = parse_region(spec)
+        except ValueError as e:
+            errors.append(f"region '{name}': {e}")
+    return regions, errors
+
+
+def crop_filter(region):
+    """ffmpeg crop filter for region, with even dimensions for yuv420p. At
+    least 2x2 pixels - a zero size fails the whole filter graph, and small
+    regions get there on small frames. ffmpeg moves the crop back inside the
+    frame if that makes it stick out."""
+    def share(value):
+        return f"{value / 100:.4f}".rstrip("0").rstrip(".")
+    # Quoted, the commas would separate filters otherwise
+    return (f"crop='max(2,trunc(iw*{share(region.width)}/2)*2)':'max(2,trunc(ih*{share(region.height)}/2)*2)'"
+            f":trunc(iw*{share(region.x)}):trunc(ih*{share(region.y)})")
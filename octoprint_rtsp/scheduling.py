@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Scheduling profile for the capture pipeline.
+
+Niceness, IO priority, CPU affinity - e.g. keep core 0 free for OctoPrint's
+serial loop - and the ffmpeg decoder/encoder thread count of the capture
+pipeline. On Linux these are per thread and inherited across fork, and
+applied to a pid from outside they would miss the decoder and encoder threads
+ffmpeg already started. So ffmpeg gets the profile at spawn: the capture
+thread applies it to itself before starting ffmpeg (apply_current()), and
+where ffmpeg is started from a shared thread - the asyncio backend on the
+server's loop, stills - the command is prefixed with nice, taskset and ionice
+(command_prefix()). The capture worker applies it to its whole process and
+the in-process PyAV backend to its capture thread.
+
+The values read back from the kernel for every thread are reported with the
+stats, so it is visible whether the limits actually hold (raising priority
+again needs root, for example). IO priority needs psutil.
+"""
+import os
+import shutil
+import sys
+import threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+IONICE_CLASSES = ("", "best-effort", "idle")
+
+# Niceness, affinity and IO priority belong to the thread, not the process
+PER_THREAD = sys.platform.startswith("linux")
+
+
+def parse_cpu_list(value):
+    """Parses "1-3,5" into [1, 2, 3, 5]. Empty means no restriction (None)."""
+    if not value:
+        return None
+    cpus = set()
+    for part in str(value).replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus) or None
+
+
+class SchedulingProfile:
+    def __init__(self, nice=None, ionice=None, cpu_affinity=None, threads=None):
+        self.nice = nice
+        self.ionice = ionice if ionice in IONICE_CLASSES else ""
+        self.threads = threads or 0  # 0 = ffmpeg decides
+        self.cpu_affinity = cpu_affinity
+        self._config_errors = []
+        if isinstance(cpu_affinity, str):
+            try:
+                self.cpu_affinity = parse_cpu_list(cpu_affinity)
+            except ValueError:
+                self.cpu_affinity = None
+                self._config_errors.append(f"invalid cpu affinity '{cpu_affinity}'")
+
+    def __bool__(self):
+        return bool(self.nice is not None or self.ionice or self.cpu_affinity or self.threads)
+
+    def to_dict(self):
+        return dict(nice=self.nice, ionice=self.ionice or None,
+                    cpu_affinity=self.cpu_affinity, threads=self.threads or None)
+
+    def _wanted(self):
+        return self.nice is not None or self.ionice or self.cpu_affinity
+
+    def apply_current(self, whole_process=False):
+        """Applies the profile to the calling thread on Linux - threads and
+        processes it starts from then on inherit it. Elsewhere these belong to
+        the process, so only with whole_process (the capture worker, which is
+        a process of its own). Returns the list of errors, or None if the
+        profile was not applied."""
+        if not self._wanted() or not (PER_THREAD or whole_process):
+            return None
+        ionice_pid = threading.get_native_id() if PER_THREAD and not whole_process else os.getpid()
+        return self._apply(0, ionice_pid)
+
+    def command_prefix(self):
+        """nice/taskset/ionice arguments to put in front of a command, for
+        spawning from a thread that must not get the profile itself. Returns
+        (arguments, errors); tools that are not installed are left out."""
+        if os.name != "posix" or not self._wanted():
+            return [], []
+        prefix, errors = [], []
+        if self.nice is not None and hasattr(os, "getpriority"):
+            if shutil.which("nice"):
+                # nice takes an increment, the profile an absolute value
+                prefix += ["nice", "-n", str(self.nice - os.getpriority(os.PRIO_PROCESS, 0))]
+            else:
+                errors.append("nice: command not found")
+        try:
+            cpus = self._cpus()
+            if cpus and shutil.which("taskset"):
+                prefix += ["taskset", "-c", ",".join(str(cpu) for cpu in sorted(cpus))]
+            elif cpus:
+                errors.append("cpu affinity: taskset not found")
+        except OSError as e:
+            errors.append(f"cpu affinity {self.cpu_affinity}: {e}")
+        if self.ionice:
+            if shutil.which("ionice"):
+                prefix += ["ionice", "-c", "3"] if self.ionice == "idle" else ["ionice", "-c", "2", "-n", "7"]
+            else:
+                errors.append("ionice: command not found")
+        return prefix, errors
+
+    def _cpus(self):
+        """The affinity cores this machine has, None for no restriction."""
+        if not self.cpu_affinity or not hasattr(os, "sched_setaffinity"):
+            return None
+        # Never pin to cores this machine doesn't have
+        cpus = set(self.cpu_affinity) & os.sched_getaffinity(0)
+        if not cpus:
+            raise OSError(f"none of the cores exist (available: {sorted(os.sched_getaffinity(0))})")
+        return cpus
+
+    def _set_ionice(self, process):
+        if self.ionice == "idle":
+            process.ionice(psutil.IOPRIO_CLASS_IDLE)
+        else:
+            process.ionice(psutil.IOPRIO_CLASS_BE, value=7)
+
+    def _apply(self, who, ionice_pid):
+        """Applies the profile to process/thread `who` (0: the calling one).
+        Returns the list of errors."""
+        errors = list(self._config_errors)
+        if self.nice is not None and hasattr(os, "setpriority"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, who, self.nice)
+            except OSError as e:
+                errors.append(f"nice {self.nice}: {e}")
+
+        try:
+            cpus = self._cpus()
+            if cpus:
+                os.sched_setaffinity(who, cpus)
+        except OSError as e:
+            errors.append(f"cpu affinity {self.cpu_affinity}: {e}")
+
+        if self.ionice:
+            if psutil is None or not hasattr(psutil, "IOPRIO_CLASS_IDLE"):
+                errors.append("ionice: needs psutil on Linux")
+            else:
+                try:
+                    self._set_ionice(psutil.Process(ionice_pid))
+                except (psutil.Error, OSError) as e:
+                    errors.append(f"ionice {self.ionice}: {e}")
+        return errors
+
+    def apply(self, pid, logger=None):
+        """Applies the profile to a process (or, on Linux, a thread id) and
+        returns the effective values (see effective())."""
+        return self._report(pid, self._apply(pid, pid), logger)
+
+    def spawned(self, pid, errors, logger=None):
+        """Like apply() for a process that got the profile at spawn, with the
+        errors from apply_current() or command_prefix(). It is left alone:
+        renicing it now would race with nice in the child."""
+        return self._report(pid, list(self._config_errors) + [e for e in errors if e not in self._config_errors],
+                            logger)
+
+    def _report(self, pid, errors, logger):
+        if errors and logger:
+            logger.warning(f"Streamor: Could not fully apply scheduling profile: {'; '.join(errors)}")
+
+        effective = self.effective(pid)
+        effective["errors"] = errors
+        return effective
+
+    @staticmethod
+    def effective(pid):
+        """Niceness, IO priority, CPU affinity and thread count of pid as the
+        kernel reports them. Niceness and affinity are read for every thread
+        of a process: the lowest niceness and all cores any thread may use,
+        so a thread that escaped the profile shows."""
+        result = dict(pid=pid, nice=None, ionice=None, cpu_affinity=None, num_threads=None)
+        nices, cpus = [], set()
+        for tid in _thread_ids(pid):
+            try:
+                if hasattr(os, "getpriority"):
+                    nices.append(os.getpriority(os.PRIO_PROCESS, tid))
+                if hasattr(os, "sched_getaffinity"):
+                    cpus.update(os.sched_getaffinity(tid))
+            except OSError:
+                pass  # thread ended meanwhile
+        if nices:
+            result["nice"] = min(nices)
+        if cpus:
+            result["cpu_affinity"] = sorted(cpus)
+
+        if psutil is not None:
+            try:
+                process = psutil.Process(pid)
+                result["num_threads"] = process.num_threads()
+                if hasattr(process, "ionice"):
+                    ionice = process.ionice()
+                    result["ionice"] = dict(ioclass=int(ionice.ioclass), value=ionice.value)
+            except (psutil.Error, OSError):
+                pass
+        return result
+
+
+def _thread_ids(pid):
+    """The threads of process pid (Linux), or just pid if it is a single
+    thread of ours or threads can't be listed."""
+    if pid != os.getpid() and os.path.isdir(f"/proc/self/task/{pid}"):
+        return [pid]
+    try:
+        return [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+    except (OSError, ValueError):
+        return [pid]
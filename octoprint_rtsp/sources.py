@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Main and sub stream sources of a camera.
+
+Most IP cameras publish a high resolution main stream and a low resolution
+sub stream. Each configured stream gets its own Streamor; requests name the
+source they need ("main" for full-size viewers and stills, "sub" for
+thumbnails, dashboards and monitoring snapshots) and fall back to the main
+stream when no sub stream is configured.
+
+Sources are started by the first request that needs them and stopped again
+once they had no viewers and no recording for idle_timeout seconds, so a
+camera nobody is watching costs no decoding at all.
+"""
+import logging
+import threading
+import time
+
+MAIN = "main"
+SUB = "sub"
+
+
+class SourceSet:
+    def __init__(self, streamors, idle_timeout=60.0, interval=5.0, logger=None):
+        """streamors maps source names to Streamors, MAIN is required.
+        idle_timeout 0 keeps sources running once started."""
+        self.streamors = dict(streamors)
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._stopping = set()  # idle sources close_idle() is stopping
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def select(self, name):
+        """The source serving requests for name."""
+        return name if name in self.streamors else MAIN
+
+    def get(self, name=MAIN):
+        """The Streamor for name, without starting it."""
+        return self.streamors[self.select(name)]
+
+    def acquire(self, name=MAIN):
+        """The running Streamor for name, started if needed."""
+        name = self.select(name)
+        streamor = self.streamors[name]
+        with self._lock:
+            self._last_used[name] = time.monotonic()
+            # A source being stopped as idle is started again by close_idle()
+            if not streamor.running and name not in self._stopping:
+                self.logger.info(f"Starting '{name}' stream source")
+                streamor.start()
+            if self.idle_timeout and self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._close_idle_loop, name="octoprint-rtsp-sources")
+                self._thread.daemon = True
+                self._thread.start()
+        return streamor
+
+    def set_profile(self, profile):
+        """Switches every source to the named capture profile. Returns True
+        if any of them changed."""
+        changed = [streamor.set_profile(profile) for streamor in self.streamors.values()]
+        return any(changed)
+
+    def stop(self):
+        self._stopped.set()
+        for streamor in self.streamors.values():
+            streamor.stop()
+
+    def get_stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {name: dict(running=streamor.running,
+                               url=streamor._sanitize_url(streamor.url),
+                               clients=streamor.clients,
+                               idle=round(now - self._last_used[name], 1)
+                               if name in self._last_used else None)
+                    for name, streamor in self.streamors.items()}
+
+    def close_idle(self):
+        """Stops sources that had no viewers or recording for idle_timeout
+        seconds."""
+        now = time.monotonic()
+        idle = []
+        with self._lock:
+            for name, streamor in self.streamors.items():
+                if not streamor.running or name in self._stopping:
+                    continue
+                recorder = streamor.recorder
+                # A recorder that hit its cap stays for its stats, it no longer records
+                if streamor.viewers > 0 or (recorder and recorder.active):
+                    self._last_used[name] = now
+                elif now - self._last_used.get(name, now) >= self.idle_timeout:
+                    self._stopping.add(name)
+                    idle.append(name)
+
+        # Stopping waits for the capture to end - acquire(), partly called on
+        # the IOLoop, must not wait for that
+        for name in idle:
+            streamor = self.streamors[name]
+            self.logger.info(f"Stopping '{name}' stream source, idle for {self.idle_timeout:g}s")
+            streamor.stop()
+            with self._lock:
+                self._stopping.discard(name)
+                if self._last_used.get(name, now) > now and not self._stopped.is_set():
+                    # Requested again while stopping
+                    self.logger.info(f"Starting '{name}' stream source")
+                    streamor.start()
+
+    def _close_idle_loop(self):
+        # Runs while any source does; acquire() starts it again
+        while not self._stopped.wait(self.interval):
+            self.close_idle()
+            with self._lock:
+                if not any(streamor.running for streamor in self.streamors.values()):
+                    break
+        with self._lock:
+            self._thread = None
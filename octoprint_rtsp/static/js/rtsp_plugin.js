@@ -22,23 +22,81 @@ $(function () {
             self.previewUrl(baseUrl + "/plugin/rtsp/snapshot?t=" + Date.now());
         };
 
+        // Live diagnostics - pushed by the server about once per second while
+        // we hold a lease, which is renewed as long as the dialog is open
+        self.diagnostics = ko.observable(null);
+        self.diagnosticsTimer = null;
+
+        self.formatStat = function (value, unit) {
+            return value === null || value === undefined ? "-" : value + unit;
+        };
+
+        self.setDiagnostics = function (enabled) {
+            $.ajax({
+                url: API_BASEURL + "plugin/rtsp/diagnostics",
+                type: "POST",
+                contentType: "application/json; charset=UTF-8",
+                data: JSON.stringify({ enabled: enabled })
+            });
+        };
+
+        self.onDataUpdaterPluginMessage = function (plugin, data) {
+            if (plugin !== "rtsp" || data.type !== "diagnostics") {
+                return;
+            }
+            self.diagnostics(data.stats);
+        };
+
+        self.ptzError = function (text) {
+            new PNotify({
+                title: "PTZ Error",
+                text: text || "Unknown error",
+                type: "error"
+            });
+        };
+
+        // Commands are queued server side; poll until the camera answered
+        self.pollPtz = function (direction, command, attempts) {
+            if (command.status === "done") {
+                new PNotify({
+                    title: "PTZ Success",
+                    text: "Command " + direction + " sent successfully.",
+                    type: "success"
+                });
+                return;
+            }
+            if (command.status === "failed") {
+                self.ptzError(command.error);
+                return;
+            }
+            if (attempts <= 0) {
+                self.ptzError("Timed out waiting for the camera");
+                return;
+            }
+
+            setTimeout(function () {
+                $.ajax({
+                    url: API_BASEURL + "plugin/rtsp/control/status/" + command.id,
+                    type: "GET",
+                    success: function (status) {
+                        self.pollPtz(direction, status, attempts - 1);
+                    },
+                    error: function (xhr) {
+                        self.ptzError(xhr.responseText);
+                    }
+                });
+            }, 250);
+        };
+
         self.testPtz = function (direction) {
             $.ajax({
                 url: API_BASEURL + "plugin/rtsp/control/" + direction,
                 type: "POST",
-                success: function () {
-                    new PNotify({
-                        title: "PTZ Success",
-                        text: "Command " + direction + " sent successfully.",
-                        type: "success"
-                    });
+                success: function (command) {
+                    self.pollPtz(direction, command, 40);
                 },
                 error: function (xhr) {
-                    new PNotify({
-                        title: "PTZ Error",
-                        text: xhr.responseText || "Unknown error",
-                        type: "error"
-                    });
+                    self.ptzError(xhr.responseText);
                 }
             });
         };
@@ -46,6 +104,19 @@ $(function () {
         // Refresh preview when settings opened
         self.onSettingsShown = function() {
             self.refreshPreview();
+            self.setDiagnostics(true);
+            self.diagnosticsTimer = setInterval(function () {
+                self.setDiagnostics(true);
+            }, 10000);
+        };
+
+        self.onSettingsHidden = function() {
+            if (self.diagnosticsTimer) {
+                clearInterval(self.diagnosticsTimer);
+                self.diagnosticsTimer = null;
+            }
+            self.setDiagnostics(false);
+            self.diagnostics(null);
         };
     }
 
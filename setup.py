@@ -37,7 +37,10 @@ setup_parameters = {
     "include_package_data": True,
     "zip_safe": False,
     "install_requires": plugin_requires,
-    "extras_require": {},
+    "extras_require": {
+        # In-process capture backend
+        "pyav": ["av>=10"]
+    },
     "entry_points": {
         "octoprint.plugin": [
             f"{plugin_identifier} = {plugin_package}"
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the ffmpeg binary, used by the tests so they run without ffmpeg
+or a camera.
+
+Answers the capability probes (-version, -h full, -muxers, -encoders,
+-decoders) and otherwise streams tiny JPEG frames to stdout at the -r rate,
+writing -progress blocks to the given pipe.
+
+Environment:
+    FAKE_FFMPEG_LEGACY=1    behave like ffmpeg 4.2 (-stimeout, no level+ prefix)
+    FAKE_FFMPEG_FRAMES=N    exit after N frames (simulates a camera drop)
+    FAKE_FFMPEG_LOG=path    append every invocation's arguments to this file
+
+-frames:v N stops after N frames, like the real thing. Further outputs to
+pipe:N (region crops) get a small frame naming the output's index, or a flat
+gray 32x18 thumbnail if the output is -f rawvideo (the luma output).
+"""
+import os
+import sys
+import time
+
+# The backends' LUMA_SIZE, the thumbnail of a featureless scene
+LUMA = b'\x80' * (32 * 18)
+
+# Padded to the size of a real 640x480 MJPEG frame
+FRAME = b'\xff\xd8\xff\xe0fake-frame' + b'\x00' * 40000 + b'\xff\xd9'
+
+LEGACY = os.environ.get("FAKE_FFMPEG_LEGACY") == "1"
+VERSION = "4.2.7-0ubuntu0.1" if LEGACY else "6.1.1-3ubuntu5"
+
+OPTIONS = ["y", "i", "f", "r", "s", "vf", "pix_fmt", "vcodec", "threads", "progress",
+           "nostats", "loglevel", "fflags", "flags", "rtsp_transport", "rtsp_flags",
+           "sws_flags", "timeout", "skip_frame", "filter_complex", "map", "frames", "vsync"]
+OPTIONS += ["stimeout"] if LEGACY else ["reconnect", "fps_mode"]
+
+
+def table(kind, rows):
+    lines = [f"{kind}:", " ------"]
+    lines += [f" {flags} {name:<20} {name} description" for flags, name in rows]
+    return "\n".join(lines)
+
+
+def output_format(args, output):
+    """The -f given for output: the last one before it."""
+    formats = [args[i + 1] for i in range(args.index(output)) if args[i] == "-f"]
+    return formats[-1] if formats else None
+
+
+def main(args):
+    log = os.environ.get("FAKE_FFMPEG_LOG")
+    if log:
+        with open(log, "a") as f:
+            f.write(" ".join(args) + "\n")
+
+    if "-version" in args:
+        print(f"ffmpeg version {VERSION} Copyright (c) 2000-2023 the FFmpeg developers")
+        return 0
+    if "-h" in args:
+        print("Global options (affect whole program instead of just one file):")
+        for option in OPTIONS:
+            # Newer builds mark per-stream options
+            spec = "[:<stream_spec>]" if option == "fps_mode" else ""
+            print(f"-{option}{spec}  <value>  fake option")
+        return 0
+    if "-muxers" in args:
+        print(table("File formats", [("E", "image2pipe"), ("E", "mjpeg"), ("E", "mpjpeg")]))
+        return 0
+    if "-encoders" in args:
+        print(table("Encoders", [("V....D", "mjpeg"), ("V....D", "libx264")]))
+        return 0
+    if "-decoders" in args:
+        print(table("Decoders", [("VFS..D", "h264"), ("VF...D", "mjpeg")]))
+        return 0
+
+    fps = float(args[args.index("-r") + 1]) if "-r" in args else 15.0
+    limit = int(os.environ.get("FAKE_FFMPEG_FRAMES", "0"))
+    if "-frames:v" in args:
+        limit = int(args[args.index("-frames:v") + 1])
+
+    progress = None
+    if "-progress" in args:
+        target = args[args.index("-progress") + 1]
+        if target.startswith("pipe:"):
+            progress = int(target[5:])
+
+    # Every "pipe:N" that isn't the -progress target is an extra output
+    outputs = [int(arg[5:]) for i, arg in enumerate(args)
+               if arg.startswith("pipe:") and args[i - 1] != "-progress"]
+    raw = {fd for fd in outputs if output_format(args, f"pipe:{fd}") == "rawvideo"}
+
+    frames = 0
+    started = time.time()
+    try:
+        while not limit or frames < limit:
+            sys.stdout.buffer.write(FRAME)
+            sys.stdout.buffer.flush()
+            for index, fd in enumerate(outputs):
+                if fd in raw:
+                    os.write(fd, LUMA)
+                else:
+                    os.write(fd, b'\xff\xd8\xff\xe0fake-roi-%d' % index + b'\x00' * 4000 + b'\xff\xd9')
+            frames += 1
+            if progress is not None and frames % max(1, int(fps)) == 0:
+                elapsed = time.time() - started
+                os.write(progress, (f"frame={frames}\nfps={frames / elapsed:.1f}\n"
+                                    f"drop_frames=0\ndup_frames=0\nspeed=1.00x\n"
+                                    f"progress=continue\n").encode())
+            time.sleep(1.0 / fps)
+    except (BrokenPipeError, KeyboardInterrupt):
+        return 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
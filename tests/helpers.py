@@ -0,0 +1,22 @@
+"""
+Shared by the tests: importing this puts the package on sys.path, so the
+tests run from a checkout without installing it.
+"""
+import os
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(TESTS_DIR))
+
+# Stand-in ffmpeg binary (see fake_ffmpeg.py)
+FAKE_FFMPEG = os.path.join(TESTS_DIR, 'fake_ffmpeg.py')
+
+
+def wait_until(condition, timeout=5):
+    """Polls condition until it is true or timeout seconds passed, returning
+    its last result."""
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Soak test for leaks that only show up after weeks of uptime.
+
+Drives many start/stop, settings-save and stream client connect/disconnect
+cycles against tests/fake_ffmpeg.py, through the real plugin, Streamor and
+MJPEG stream handler (served by an in-process Tornado server). After each
+phase it checks that traced Python memory (tracemalloc), thread count, open
+file descriptors and child processes are back where they were after a
+warm-up, and writes a report. Exits with status 1 if anything grew beyond
+its allowance, so it can gate releases.
+
+Usage:
+    python soak.py                          # 1000 cycles per phase
+    python soak.py --cycles 5000 --report soak.json
+    python soak.py --backend asyncio --phases clients
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import tornado.httpserver
+import tornado.netutil
+import tornado.web
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Add parent directory to path so we can import the plugin
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import octoprint_rtsp
+from octoprint_rtsp import MjpegStreamHandler, RtspPlugin
+from octoprint_rtsp.streamor import Streamor
+
+FAKE_FFMPEG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_ffmpeg.py")
+PHASES = ("start_stop", "settings_save", "clients")
+
+logger = logging.getLogger("soak")
+
+
+class FakeSettings:
+    """The parts of OctoPrint's PluginSettings the plugin uses."""
+
+    def __init__(self, defaults, **values):
+        self.data = dict(defaults, **values)
+
+    def get(self, path):
+        return self.data.get(path[0])
+
+    def get_int(self, path):
+        value = self.get(path)
+        return int(value) if value not in (None, "") else None
+
+    def get_float(self, path):
+        value = self.get(path)
+        return float(value) if value not in (None, "") else None
+
+    def get_boolean(self, path):
+        return bool(self.get(path))
+
+    def get_all_data(self):
+        return dict(self.data)
+
+    def set(self, path, value):
+        self.data.update(value)
+
+    def clean_all_data(self):
+        pass
+
+
+class FakePrinter:
+    def is_printing(self):
+        return False
+
+
+def make_plugin(data_folder, backend, loop):
+    plugin = RtspPlugin()
+    plugin._identifier = "rtsp"
+    plugin._logger = logger
+    plugin._printer = FakePrinter()
+    plugin._settings = FakeSettings(plugin.get_settings_defaults(), rtsp_url="rtsp://fake",
+                                    ffmpeg_path=FAKE_FFMPEG, capture_backend=backend,
+                                    stream_fps=30, poster_interval=0)
+    plugin.get_plugin_data_folder = lambda: data_folder
+    plugin._loop = loop
+    return plugin
+
+
+class Server:
+    """The plugin's /stream handler on an event loop thread."""
+
+    def __init__(self, port=0):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="soak-ioloop", daemon=True)
+        self.thread.start()
+        self.port = asyncio.run_coroutine_threadsafe(self._listen(port), self.loop).result()
+
+    async def _listen(self, port):
+        app = tornado.web.Application([(r"/stream", MjpegStreamHandler, {})])
+        sockets = tornado.netutil.bind_sockets(port, "127.0.0.1")
+        self.server = tornado.httpserver.HTTPServer(app)
+        self.server.add_sockets(sockets)
+        return sockets[0].getsockname()[1]
+
+    def close(self):
+        async def shutdown():
+            self.server.stop()
+            await self.server.close_all_connections()
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def measure():
+    gc.collect()
+    return dict(
+        memory=tracemalloc.get_traced_memory()[0],
+        threads=threading.active_count(),
+        fds=len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None,
+        children=len(psutil.Process().children(recursive=True)) if psutil else None,
+    )
+
+
+def settle(baseline, timeout=5.0):
+    """Measures once threads, fds and children are back at the baseline, or
+    after timeout - threads and processes take a moment to wind down."""
+    deadline = time.time() + timeout
+    while True:
+        current = measure()
+        settled = all(current[key] is None or current[key] <= baseline[key]
+                      for key in ("threads", "fds", "children"))
+        if settled or time.time() > deadline:
+            return current
+        time.sleep(0.1)
+
+
+def cycle_start_stop(context, i):
+    streamor = Streamor("rtsp://fake", framerate=30, ffmpeg_path=FAKE_FFMPEG, poster_interval=0,
+                        backend=context["backend"], loop=context["server"].loop, logger=logger)
+    streamor.start()
+    try:
+        if not streamor.wait_for_frame(timeout=5.0):
+            raise RuntimeError("no frame within 5s")
+    finally:
+        streamor.stop()
+
+
+def cycle_settings_save(context, i):
+    plugin = context["plugin"]
+    plugin.on_settings_save(dict(stream_fps=30 - i % 2))
+    if not plugin._ensure_streamor().wait_for_frame(timeout=5.0):
+        raise RuntimeError("no frame within 5s")
+
+
+def cycle_clients(context, i):
+    connection = socket.create_connection(("127.0.0.1", context["server"].port), timeout=5)
+    try:
+        connection.sendall(b"GET /stream HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        # Hang up at different points: before, during and after the first frame
+        wanted = (0, 100, 50000)[i % 3]
+        received = b""
+        while len(received) < wanted:
+            data = connection.recv(65536)
+            if not data:
+                raise RuntimeError("stream ended early")
+            received += data
+        if i % 2:
+            # Abrupt disconnect: RST instead of FIN
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    finally:
+        connection.close()
+
+
+CYCLES = dict(start_stop=cycle_start_stop, settings_save=cycle_settings_save, clients=cycle_clients)
+
+
+def reset(context):
+    # Settings saves and clients leave the plugin's stream running
+    plugin = context["plugin"]
+    if plugin._sources:
+        plugin._sources.stop()
+
+
+def run_phase(name, context, cycles, warmup):
+    for i in range(warmup):
+        CYCLES[name](context, i)
+    reset(context)
+    time.sleep(0.5)  # let the stopped sources wind down
+    baseline = measure()
+
+    started = time.time()
+    errors = 0
+    for i in range(cycles):
+        try:
+            CYCLES[name](context, i)
+        except Exception as e:
+            errors += 1
+            logger.warning(f"{name} cycle {i}: {e}")
+
+    # Handlers notice a hang up within one frame wait and unregister
+    streamor = context["plugin"]._streamor
+    deadline = time.time() + 5
+    while streamor and streamor.clients and time.time() < deadline:
+        time.sleep(0.05)
+    clients = streamor.clients if streamor else 0
+    reset(context)
+    after = settle(baseline)
+    return dict(phase=name, cycles=cycles, errors=errors, seconds=round(time.time() - started, 1),
+                baseline=baseline, after=after, clients_left=clients)
+
+
+def check(result, max_memory_growth):
+    """Returns the list of allowances the phase exceeded."""
+    failures = []
+    baseline, after = result["baseline"], result["after"]
+    if result["errors"]:
+        failures.append(f"{result['errors']} failed cycles")
+    if result["clients_left"]:
+        failures.append(f"{result['clients_left']} stream clients still registered")
+    for key in ("threads", "fds", "children"):
+        if after[key] is not None and after[key] > baseline[key]:
+            failures.append(f"{key} grew from {baseline[key]} to {after[key]}")
+    growth = after["memory"] - baseline["memory"]
+    if growth > max_memory_growth:
+        failures.append(f"traced memory grew by {growth / 1024:.0f} KB")
+    return failures
+
+
+def run_soak(cycles=1000, backend="ffmpeg", phases=PHASES, max_memory_growth=256 * 1024, warmup=None):
+    """Runs the phases and returns the report."""
+    warmup = warmup if warmup is not None else max(3, min(50, cycles // 10))
+    tracemalloc.start()
+    server = Server()
+    results = []
+    with tempfile.TemporaryDirectory() as data_folder:
+        plugin = make_plugin(data_folder, backend, server.loop)
+        context = dict(backend=backend, server=server, plugin=plugin)
+        octoprint_rtsp._plugin_instance = plugin
+        try:
+            for name in phases:
+                result = run_phase(name, context, cycles, warmup)
+                result["failures"] = check(result, max_memory_growth)
+                results.append(result)
+        finally:
+            reset(context)
+            octoprint_rtsp._plugin_instance = None
+            server.close()
+            tracemalloc.stop()
+
+    return dict(
+        backend=backend,
+        cycles=cycles,
+        python=sys.version.split()[0],
+        max_memory_growth=max_memory_growth,
+        phases=results,
+        passed=not any(result["failures"] for result in results),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test for memory, thread, fd and process leaks")
+    parser.add_argument("--cycles", type=int, default=1000, help="cycles per phase")
+    parser.add_argument("--backend", default="ffmpeg", choices=("ffmpeg", "asyncio"))
+    parser.add_argument("--phases", default=",".join(PHASES))
+    parser.add_argument("--max-memory-growth", type=int, default=256, help="KB of traced memory growth allowed")
+    parser.add_argument("--report", help="write the JSON report to this file")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR,
+                        format='%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')
+
+    report = run_soak(args.cycles, args.backend, args.phases.split(","), args.max_memory_growth * 1024)
+
+    print(f"{'phase':<14} {'cycles':>7} {'secs':>7} {'memory KB':>10} {'threads':>8} {'fds':>6} {'children':>9}")
+    for result in report["phases"]:
+        baseline, after = result["baseline"], result["after"]
+        delta = {key: (after[key] - baseline[key]) if after[key] is not None else "-" for key in after}
+        print(f"{result['phase']:<14} {result['cycles']:>7} {result['seconds']:>7} "
+              f"{delta['memory'] / 1024:>+10.0f} {delta['threads']:>+8} {delta['fds']:>+6} {delta['children']:>+9}")
+        for failure in result["failures"]:
+            print(f"    FAIL: {failure}")
+    print("PASSED" if report["passed"] else "FAILED")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import os
+import time
+import asyncio
+import tempfile
+import threading
+
+from helpers import FAKE_FFMPEG, wait_until
+
+from octoprint_rtsp.streamor import Streamor
+from octoprint_rtsp import backends
+from octoprint_rtsp.backends import AsyncioFfmpegBackend
+from octoprint_rtsp.regions import Region
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+class LoopThread:
+    """An event loop on its own thread, standing in for the server's IOLoop."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine, timeout=5):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+@unittest.skipUnless(AsyncioFfmpegBackend.available(), "POSIX only")
+class TestAsyncioIngest(unittest.TestCase):
+    def setUp(self):
+        self.loop = LoopThread()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def streamor(self, **kwargs):
+        return Streamor("rtsp://fake", framerate=30, ffmpeg_path=FAKE_FFMPEG, poster_interval=0,
+                        backend="asyncio", loop=self.loop.loop, logger=MagicMock(), **kwargs)
+
+    def test_captures_on_the_loop_without_threads(self):
+        async def warm_executor():
+            await asyncio.get_running_loop().run_in_executor(None, time.sleep, 0)
+
+        # ffmpeg probes run on the loop's shared executor, not a thread per camera
+        self.loop.run(warm_executor())
+        threads = threading.active_count()
+        s = self.streamor()
+        s.start()
+        try:
+            self.assertIsNone(s.thread)
+            self.assertTrue(wait_until(lambda: s.get_stats()['frames_captured'] >= 30
+                                       and s.get_stats()['ffmpeg']))
+            self.assertEqual(threading.active_count(), threads)
+            self.assertIn(b'fake-frame', s.get_snapshot())
+            self.assertTrue(s.capture_alive)
+        finally:
+            s.stop()
+        self.assertFalse(s.capture_alive)
+        self.assertIsNone(s.backend.process)
+
+    def test_next_frame_waits_without_blocking_the_loop(self):
+        s = self.streamor()
+        s.start()
+        try:
+            frame, seq, captured = self.loop.run(s.next_frame(s.frame_seq, timeout=5))
+            self.assertIn(b'fake-frame', frame)
+            self.assertGreater(seq, 0)
+
+            # Nothing new after stopping: times out
+            s.stop()
+            self.assertIsNone(self.loop.run(s.next_frame(s.frame_seq, timeout=0.1)))
+        finally:
+            s.stop()
+
+    def test_blocking_work_stays_off_the_loop(self):
+        threads = {}
+
+        def record(name, function):
+            def wrapper(*args, **kwargs):
+                threads.setdefault(name, threading.current_thread())
+                return function(*args, **kwargs)
+            return wrapper
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch('octoprint_rtsp.backends.probe_ffmpeg', record('probe', backends.probe_ffmpeg)):
+            s = Streamor("rtsp://fake", framerate=30, ffmpeg_path=FAKE_FFMPEG, poster_interval=0.01,
+                         poster_path=os.path.join(tmp, 'poster.jpg'), backend="asyncio",
+                         loop=self.loop.loop, logger=MagicMock())
+            s._save_poster = record('poster', s._save_poster)
+            s.start_recording(os.path.join(tmp, 'recording.bin'))
+            s.recorder.write = record('recording', s.recorder.write)
+            s.start()
+            try:
+                self.assertTrue(wait_until(lambda: len(threads) == 3 and s.recorder.frames >= 3))
+            finally:
+                s.stop()
+                s.stop_recording()
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'poster.jpg')))
+
+        for name, thread in threads.items():
+            self.assertIsNot(thread, self.loop.thread, name)
+
+    def test_without_loop_falls_back_to_a_thread(self):
+        s = Streamor("rtsp://fake", framerate=30, ffmpeg_path=FAKE_FFMPEG, poster_interval=0,
+                     backend="asyncio", logger=MagicMock())
+        s.start()
+        try:
+            self.assertTrue(s.thread.is_alive())
+            self.assertTrue(s.wait_for_frame(timeout=5))
+        finally:
+            s.stop()
+
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'), "needs /proc")
+    def test_restart_soak_leaks_no_threads_fds_or_children(self):
+        s = self.streamor()
+        s.start()
+        try:
+            self.assertTrue(wait_until(lambda: s.get_stats()['frames_captured'] > 0))
+            threads, fds = threading.active_count(), open_fds()
+
+            for i in range(25):
+                restarts = s.backend.restarts
+                s.backend.reconfigure()
+                self.assertTrue(wait_until(lambda: s.backend.restarts > restarts and s.backend.process))
+            self.assertTrue(wait_until(lambda: s.frame_seq > 0))
+
+            self.assertEqual(threading.active_count(), threads)
+            self.assertEqual(open_fds(), fds)
+            if psutil:
+                self.assertLessEqual(len(psutil.Process().children()), 1)
+        finally:
+            s.stop()
+
+        self.assertTrue(wait_until(lambda: open_fds() < fds))
+        if psutil:
+            self.assertEqual(psutil.Process().children(), [])
+
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'), "needs /proc")
+    def test_stopping_during_the_probe_leaks_no_fds(self):
+        probing = threading.Event()
+
+        def slow_probe(*args):
+            probing.set()
+            time.sleep(0.2)  # a cache miss runs ffmpeg several times
+            return backends.probe_ffmpeg(*args)
+
+        fds = open_fds()
+        with patch('octoprint_rtsp.backends.probe_ffmpeg', slow_probe):
+            for i in range(10):
+                probing.clear()
+                # Progress, region and luma pipes: 6 fds a cycle before the fix
+                s = self.streamor(suppress_static=True, regions=dict(nozzle=Region(40, 30, 20, 20)))
+                s.start()
+                self.assertTrue(probing.wait(5))
+                s.stop()
+                self.assertIsNone(s.backend.process)
+        # The probes still running in the executor hold no pipes of ours
+        self.assertTrue(wait_until(lambda: open_fds() <= fds))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from unittest.mock import MagicMock
+import os
+import time
+
+from helpers import wait_until
+
+from octoprint_rtsp.capture_worker import SharedFrameBuffer
+from octoprint_rtsp.rate_control import OperatingPoint
+from octoprint_rtsp.streamor import Streamor
+
+class TestSharedFrameBuffer(unittest.TestCase):
+    def setUp(self):
+        self.frames = SharedFrameBuffer.create(slots=3, slot_size=64)
+
+    def tearDown(self):
+        self.frames.close()
+
+    def test_read_returns_latest_frame_once(self):
+        self.assertEqual(self.frames.read(0), (0, None))
+
+        self.frames.write(b'first')
+        self.frames.write(b'second')
+        generation, frame = self.frames.read(0)
+        self.assertEqual(frame, b'second')
+
+        # Nothing new since
+        self.assertEqual(self.frames.read(generation), (generation, None))
+
+        self.frames.write(b'third')
+        self.assertEqual(self.frames.read(generation)[1], b'third')
+
+    def test_oversized_frame_dropped(self):
+        self.assertFalse(self.frames.write(b'x' * 65))
+        self.assertEqual(self.frames.read(0), (0, None))
+
+    def test_attached_reader_sees_writer(self):
+        reader = SharedFrameBuffer.attach(self.frames.name, 3, 64)
+        try:
+            self.frames.write(b'shared')
+            self.assertEqual(reader.read(0)[1], b'shared')
+        finally:
+            reader.close()
+
+class TestCaptureProcess(unittest.TestCase):
+    def test_frames_arrive_from_worker_process(self):
+        s = Streamor("TEST", framerate=30, capture_process=True)
+        s.start()
+        try:
+            frame = None
+            deadline = time.time() + 20
+            while not frame and time.time() < deadline:
+                frame = s.get_snapshot()
+                time.sleep(0.05)
+
+            self.assertIsNotNone(frame)
+            self.assertTrue(frame.startswith(b'\xff\xd8'))
+            self.assertNotEqual(s._worker.process.pid, os.getpid())
+        finally:
+            process = s._worker.process
+            s.stop()
+
+        self.assertFalse(process.is_alive())
+
+    def test_reconfigure_keeps_the_worker(self):
+        s = Streamor("TEST", framerate=30, capture_process=True, logger=MagicMock(),
+                     profiles=dict(printing=dict(framerate=5)))
+        s.start()
+        try:
+            process = s._worker.process
+            s.set_operating_point(OperatingPoint(8, 10, 1.0))
+            s.set_profile("printing")
+
+            # Applied by the running worker, which logs through ours
+            def reconfigured():
+                return [record.getMessage() for (record,), _ in s.logger.handle.call_args_list
+                        if "reconfigured" in record.getMessage()]
+            self.assertTrue(wait_until(lambda: len(reconfigured()) == 2, timeout=20))
+            self.assertIn("operating point (8, 10, 1.0)", reconfigured()[0])
+            self.assertIn("5 fps", reconfigured()[1])
+            self.assertIs(s._worker.process, process)
+            self.assertTrue(process.is_alive())
+
+            seq = s.frame_seq
+            self.assertTrue(wait_until(lambda: s.frame_seq > seq))
+            s.logger.error.assert_not_called()
+        finally:
+            s.stop()
+        self.assertFalse(process.is_alive())
+        s.logger.error.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import time
+import threading
+
+from helpers import wait_until
+
+from octoprint_rtsp.diagnostics import DiagnosticsCollector, summarize
+from octoprint_rtsp.streamor import Streamor
+
+class TestSummarize(unittest.TestCase):
+    def test_rates(self):
+        s = Streamor("rtsp://fake", poster_interval=0)
+        before = s.get_stats()
+        for i in range(10):
+            s._publish(b'\xff\xd8' + b'%d' % i * 1000 + b'\xff\xd9')
+        s.clients = 2
+        for _ in range(4):
+            s.count_client_frame(1000, latency=0.05)
+        sample = summarize(before, s.get_stats(), 2.0)
+
+        self.assertEqual(sample['capture_fps'], 5.0)
+        self.assertEqual(sample['published_fps'], 5.0)
+        self.assertEqual(sample['delivered_fps'], 1.0)
+        self.assertEqual(sample['viewers'], 2)
+        self.assertEqual(sample['latency_ms'], 50.0)
+        self.assertAlmostEqual(sample['bitrate_kbps'], 10 * 1004 * 8 / 2 / 1000, places=1)
+        self.assertAlmostEqual(sample['avg_frame_kb'], 1004 / 1024, places=1)
+
+class TestDiagnosticsCollector(unittest.TestCase):
+    def setUp(self):
+        self.streamor = Streamor("TEST", framerate=50, poster_interval=0)
+        self.streamor.start()
+        self.messages = []
+        self.collector = DiagnosticsCollector(lambda: self.streamor, self.messages.append,
+                                              interval=0.05, lease=0.5)
+
+    def tearDown(self):
+        self.collector.stop()
+        self.streamor.stop()
+
+    def test_idle_until_renewed(self):
+        time.sleep(0.2)
+        self.assertEqual(self.messages, [])
+        self.assertFalse(self.collector.active)
+
+    def test_pushes_while_leased_and_stops(self):
+        self.collector.renew()
+        self.assertTrue(wait_until(lambda: len(self.messages) >= 3))
+        self.assertGreater(self.messages[-1]['capture_fps'], 0)
+        self.assertIn('ffmpeg_cpu', self.messages[-1])
+
+        self.collector.stop()
+        self.assertTrue(wait_until(lambda: not self.collector.active))
+        count = len(self.messages)
+        time.sleep(0.2)
+        self.assertEqual(len(self.messages), count)
+
+    def test_lease_expires(self):
+        threads = threading.active_count()
+        self.collector.renew()
+        self.assertTrue(self.collector.active)
+        self.assertTrue(wait_until(lambda: not self.collector.active, timeout=3))
+        self.assertTrue(wait_until(lambda: threading.active_count() == threads))
+
+if __name__ == '__main__':
+    unittest.main()
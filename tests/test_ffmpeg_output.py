@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import MagicMock
+import logging
+
+import helpers  # puts the package on sys.path
+
+from octoprint_rtsp.ffmpeg_output import FfmpegLogFilter, ProgressParser
+
+class TestProgressParser(unittest.TestCase):
+    def test_block_parsed_on_progress_line(self):
+        parser = ProgressParser()
+        lines = [
+            "frame=150", "fps=14.9", "bitrate=1843.2kbits/s", "total_size=2304000",
+            "out_time_us=10000000", "dup_frames=3", "drop_frames=1", "speed=0.99x",
+        ]
+        for line in lines:
+            self.assertIsNone(parser.feed(line))
+
+        block = parser.feed("progress=continue")
+        self.assertEqual(block['frames'], 150)
+        self.assertAlmostEqual(block['fps'], 14.9)
+        self.assertAlmostEqual(block['bitrate_kbps'], 1843.2)
+        self.assertEqual(block['dup_frames'], 3)
+        self.assertEqual(block['drop_frames'], 1)
+        self.assertAlmostEqual(block['speed'], 0.99)
+        self.assertAlmostEqual(block['out_time'], 10.0)
+        self.assertEqual(block['state'], 'continue')
+
+        # Next block starts empty
+        self.assertNotIn('frames', parser.feed("progress=end"))
+
+    def test_not_available_values(self):
+        parser = ProgressParser()
+        parser.feed("bitrate=N/A")
+        parser.feed("speed=N/A")
+        block = parser.feed("progress=continue")
+        self.assertIsNone(block['bitrate_kbps'])
+        self.assertIsNone(block['speed'])
+
+class TestFfmpegLogFilter(unittest.TestCase):
+    def setUp(self):
+        self.logger = MagicMock()
+        self.log_filter = FfmpegLogFilter(self.logger, window=60.0, max_lines=3)
+
+    def test_severity_classification(self):
+        self.assertEqual(self.log_filter.classify("[rtsp @ 0x55d1] method DESCRIBE failed: 401 Unauthorized"), logging.ERROR)
+        self.assertEqual(self.log_filter.classify("[mjpeg @ 0x55d1] deprecated pixel format used"), logging.WARNING)
+
+    def test_duplicates_collapsed(self):
+        self.assertTrue(self.log_filter.handle("[h264 @ 0x1] error while decoding MB 12 34", now=0))
+        self.assertFalse(self.log_filter.handle("[h264 @ 0x2] error while decoding MB 56 7", now=1))
+        self.assertFalse(self.log_filter.handle("[h264 @ 0x1] error while decoding MB 1 2", now=2))
+        self.assertEqual(self.logger.log.call_count, 1)
+
+        # After the window the next occurrence reports the collapsed repeats
+        self.assertTrue(self.log_filter.handle("[h264 @ 0x1] error while decoding MB 9 9", now=61))
+        self.assertIn("repeated 2 times", self.logger.log.call_args[0][1])
+        self.assertEqual(self.log_filter.counts['errors'], 4)
+        self.assertEqual(self.log_filter.counts['suppressed'], 2)
+
+    def test_rate_limited_per_window(self):
+        for i, word in enumerate(["alpha", "beta", "gamma", "delta", "epsilon"]):
+            self.log_filter.handle(f"warning {word}", now=i)
+        self.assertEqual(self.logger.log.call_count, 3)
+
+        self.log_filter.handle("warning zeta", now=70)
+        self.logger.warning.assert_called_with("FFmpeg: 2 further messages suppressed")
+
+if __name__ == '__main__':
+    unittest.main()
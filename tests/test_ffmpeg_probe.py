@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import MagicMock
+import os
+import tempfile
+import shutil
+
+from helpers import FAKE_FFMPEG
+
+from octoprint_rtsp import ffmpeg_probe
+from octoprint_rtsp.ffmpeg_probe import probe_ffmpeg, FfmpegCapabilities
+from octoprint_rtsp.streamor import Streamor
+from octoprint_rtsp.backends import FfmpegBackend
+
+@unittest.skipUnless(os.name == 'posix', "fake ffmpeg is a POSIX script")
+class TestFfmpegProbe(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.tmp.name, 'invocations.log')
+        os.environ['FAKE_FFMPEG_LOG'] = self.log
+        ffmpeg_probe._memory_cache.clear()
+        self.ffmpeg = os.path.join(self.tmp.name, 'ffmpeg')
+        shutil.copy(FAKE_FFMPEG, self.ffmpeg)
+
+    def tearDown(self):
+        os.environ.pop('FAKE_FFMPEG_LOG', None)
+        os.environ.pop('FAKE_FFMPEG_LEGACY', None)
+        ffmpeg_probe._memory_cache.clear()
+        self.tmp.cleanup()
+
+    def invocations(self):
+        if not os.path.exists(self.log):
+            return 0
+        with open(self.log) as f:
+            return len(f.readlines())
+
+    def test_probe_parses_and_caches_on_disk(self):
+        caps = probe_ffmpeg(self.ffmpeg, cache_dir=self.tmp.name)
+        self.assertEqual(caps.version_tuple, (6, 1))
+        self.assertTrue(caps.has_option('timeout'))
+        self.assertFalse(caps.has_option('stimeout'))
+        self.assertTrue(caps.has_option('fps_mode'))
+        self.assertIn('mjpeg', caps.encoders)
+        self.assertIn('image2pipe', caps.muxers)
+        self.assertIn('h264', caps.decoders)
+        probes = self.invocations()
+        self.assertEqual(probes, 5)
+
+        # New process (empty memory cache) - served from disk, ffmpeg not run
+        ffmpeg_probe._memory_cache.clear()
+        cached = probe_ffmpeg(self.ffmpeg, cache_dir=self.tmp.name)
+        self.assertEqual(cached.to_dict(), caps.to_dict())
+        self.assertEqual(self.invocations(), probes)
+
+        # Replacing the binary (new mtime) invalidates the cache
+        st = os.stat(self.ffmpeg)
+        os.utime(self.ffmpeg, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+        probe_ffmpeg(self.ffmpeg, cache_dir=self.tmp.name)
+        self.assertEqual(self.invocations(), probes * 2)
+
+    def test_missing_binary(self):
+        self.assertIsNone(probe_ffmpeg(os.path.join(self.tmp.name, 'no-ffmpeg')))
+
+class TestCommandBuilder(unittest.TestCase):
+    def build(self, caps, **kwargs):
+        backend = FfmpegBackend(Streamor("rtsp://cam/live", logger=MagicMock(), **kwargs))
+        backend.capabilities = caps
+        return backend.build_command()
+
+    def test_modern_ffmpeg_uses_timeout_and_low_latency_flags(self):
+        caps = FfmpegCapabilities('/usr/bin/ffmpeg', 'ffmpeg version 6.1.1',
+                                  options=['timeout', 'rtsp_flags', 'fflags', 'flags', 'sws_flags', 'progress'])
+        args = self.build(caps, resolution='640x480')
+        self.assertNotIn('-stimeout', args)
+        self.assertEqual(args[args.index('-timeout') + 1], '5000000')
+        self.assertLess(args.index('-fflags'), args.index('-i'))
+        self.assertLess(args.index('-flags'), args.index('-i'))
+        self.assertIn('fast_bilinear', args)
+        self.assertIn('level+warning', args)
+
+    def test_legacy_ffmpeg_keeps_stimeout(self):
+        caps = FfmpegCapabilities('/usr/bin/ffmpeg', 'ffmpeg version 4.2.7',
+                                  options=['timeout', 'stimeout', 'rtsp_flags'])
+        args = self.build(caps)
+        self.assertIn('-stimeout', args)
+        self.assertNotIn('-timeout', args)
+        self.assertNotIn('-fflags', args)
+        self.assertNotIn('-sws_flags', args)
+        self.assertIn('warning', args)
+
+    def test_unprobed_falls_back_to_historical_args(self):
+        args = self.build(None)
+        self.assertIn('-stimeout', args)
+        self.assertEqual(args[0], 'ffmpeg')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import os
+import tempfile
+
+import helpers  # puts the package on sys.path
+
+from octoprint_rtsp.memory import MemoryBudget, budget
+from octoprint_rtsp.streamor import Streamor
+
+class TestMemoryBudget(unittest.TestCase):
+    def test_usage_and_high_water(self):
+        b = MemoryBudget(limit=1000)
+        b.set('a', 300, 'frames')
+        b.set('a', 100, 'frames')  # replaces, doesn't add
+        b.set('b', 250, 'parsers')
+        stats = b.get_stats()
+        self.assertEqual(stats['usage'], 350)
+        self.assertEqual(stats['categories'], dict(frames=100, parsers=250))
+        b.release('b')
+        self.assertEqual(b.get_stats()['usage'], 100)
+        self.assertEqual(b.get_stats()['high_water'], 350)
+
+    def test_drops_oldest_optional_first(self):
+        b = MemoryBudget(limit=1000)
+        dropped = []
+        b.set('old', 300, 'cache', drop=lambda: dropped.append('old'))
+        b.set('required', 300, 'frames')
+        b.set('new', 300, 'cache', drop=lambda: dropped.append('new'))
+        b.set('old', 300, 'cache', drop=lambda: dropped.append('old'))  # refreshed - now newest
+        b.set('frame2', 300, 'frames')
+        self.assertEqual(dropped, ['new'])
+        self.assertEqual(b.get_stats()['usage'], 900)
+        self.assertEqual(b.get_stats()['evictions'], 1)
+
+    def test_required_always_fits_optional_is_rejected(self):
+        b = MemoryBudget(limit=100)
+        self.assertTrue(b.set('frame', 500, 'frames'))
+        self.assertFalse(b.set('cache', 10, 'cache', drop=lambda: None))
+        stats = b.get_stats()
+        self.assertEqual(stats['usage'], 500)
+        self.assertEqual(stats['rejections'], 1)
+
+    def test_release_owner(self):
+        b = MemoryBudget()
+        b.set((1, 'frame'), 10, 'frames')
+        b.set((1, 'part'), 10, 'parts', drop=lambda: None)
+        b.set((2, 'frame'), 10, 'frames')
+        b.release_owner(1)
+        self.assertEqual(b.get_stats()['usage'], 10)
+
+class TestStreamorBudget(unittest.TestCase):
+    def test_part_is_shared_between_clients(self):
+        s = Streamor("rtsp://fake", poster_interval=0)
+        frame = b'\xff\xd8' + b'x' * 1000 + b'\xff\xd9'
+        s._publish(frame)
+        part = s.get_part(s.last_frame)
+        self.assertIs(s.get_part(s.last_frame), part)
+        self.assertTrue(part.startswith(b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: 1004\r\n\r\n\xff\xd8'))
+        self.assertTrue(part.endswith(b'\xff\xd9\r\n'))
+        s.stop()  # releases everything the streamor accounted
+        self.assertNotIn((s._budget_owner, 'frame'), budget._entries)
+
+    def test_poster_cache_dropped_under_pressure_and_reloaded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'poster.jpg')
+            poster = b'\xff\xd8' + b'p' * 5000 + b'\xff\xd9'
+            with open(path, 'wb') as f:
+                f.write(poster)
+
+            tight = MemoryBudget(limit=8000)
+            with patch('octoprint_rtsp.streamor.budget', tight):
+                s = Streamor("rtsp://fake", poster_path=path, poster_interval=0, logger=MagicMock())
+                self.assertEqual(s.poster_frame, poster)
+
+                # A big live frame squeezes the optional poster cache out
+                s._publish(b'\xff\xd8' + b'f' * 5000 + b'\xff\xd9')
+                self.assertIsNone(s.poster_frame)
+                self.assertEqual(tight.get_stats()['categories'], dict(frames=5004))
+
+                # ...but it's still served, from disk
+                frame, age = s.get_poster()
+                self.assertEqual(frame, poster)
+                s.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import time
+import threading
+
+from helpers import wait_until
+
+from octoprint_rtsp.pacing import FramePacer
+from octoprint_rtsp.streamor import Streamor
+
+class TestFramePacer(unittest.TestCase):
+    def setUp(self):
+        self.released = []
+        self.lock = threading.Lock()
+
+    def release(self, frame, captured):
+        with self.lock:
+            self.released.append((time.monotonic(), frame))
+
+    def test_bursts_come_out_steady(self):
+        pacer = FramePacer(self.release, lambda: 20, max_latency=0.2)
+        pacer.start()
+        try:
+            # 3 frames within 2 ms every 150 ms: 20 fps on average, all bursts
+            for burst in range(10):
+                for i in range(3):
+                    pacer.submit(b'%d-%d' % (burst, i))
+                    time.sleep(0.001)
+                time.sleep(0.147)
+            time.sleep(0.2)
+        finally:
+            pacer.stop()
+
+        stats = pacer.get_stats()
+        self.assertEqual(stats['frames_in'], 30)
+        self.assertEqual(stats['frames_out'] + stats['frames_dropped'], 30)
+        self.assertGreater(stats['frames_dropped'], 0)
+        # Never faster than the clock...
+        times = [t for t, _ in self.released]
+        self.assertGreaterEqual(min(b - a for a, b in zip(times, times[1:])), 0.045)
+        # ...and much steadier than what went in
+        self.assertLess(stats['jitter_out_ms'], stats['jitter_in_ms'] / 2)
+        self.assertLessEqual(stats['latency_max_ms'], 200 + 20)
+        # The newest frame of the last burst made it out
+        self.assertEqual(self.released[-1][1], b'9-2')
+
+    def test_max_latency_bounds_the_hold(self):
+        pacer = FramePacer(self.release, lambda: 2, max_latency=0.05)
+        pacer.start()
+        try:
+            pacer.submit(b'first')
+            self.assertTrue(wait_until(lambda: len(self.released) == 1))
+            submitted = time.monotonic()
+            pacer.submit(b'second')  # next tick would be 500 ms away
+            self.assertTrue(wait_until(lambda: len(self.released) == 2))
+        finally:
+            pacer.stop()
+        self.assertLess(self.released[1][0] - submitted, 0.2)
+
+    def test_stop_drops_pending_frame(self):
+        pacer = FramePacer(self.release, lambda: 1, max_latency=10)
+        pacer.start()
+        pacer.submit(b'first')
+        self.assertTrue(wait_until(lambda: len(self.released) == 1))
+        pacer.submit(b'second')
+        pacer.stop()
+        time.sleep(0.05)
+        self.assertEqual(len(self.released), 1)
+
+class TestStreamorPacing(unittest.TestCase):
+    def test_paced_publish(self):
+        s = Streamor("rtsp://fake", framerate=10, poster_interval=0, pacing=True, pacing_max_latency=0.5)
+        s.pacer.start()
+        try:
+            before = time.time()
+            for i in range(3):
+                s._publish(b'\xff\xd8%d\xff\xd9' % i)
+            self.assertTrue(wait_until(lambda: s.get_stats()['pacing']['frames_in'] == 3
+                                       and s.get_snapshot() == b'\xff\xd82\xff\xd9'))
+            stats = s.get_stats()
+        finally:
+            s.pacer.stop()
+
+        self.assertEqual(stats['frames_captured'], 3)
+        self.assertEqual(stats['frames_published'] + stats['frames_dropped'], 3)
+        self.assertGreaterEqual(stats['frames_dropped'], 1)
+        self.assertEqual(stats['bytes_dropped'], 5 * stats['frames_dropped'])
+        # Latency is measured from capture, not from the paced release
+        self.assertLess(s.last_frame_time - before, 0.05)
+
+if __name__ == '__main__':
+    unittest.main()
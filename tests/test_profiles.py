@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import time
+import subprocess
+
+import helpers  # puts the package on sys.path
+
+from octoprint_rtsp.profiles import IDLE, PRINTING, PipelineCpuMeter
+from octoprint_rtsp.streamor import Streamor
+from octoprint_rtsp.backends import FfmpegBackend
+from octoprint_rtsp.ffmpeg_probe import FfmpegCapabilities
+from octoprint_rtsp.regions import Region
+
+PRINTING_PROFILE = {PRINTING: dict(framerate=5, resolution="320x240", keyframes_only=True)}
+
+class TestProfiles(unittest.TestCase):
+    def test_switch_changes_command_and_back(self):
+        s = Streamor("rtsp://cam/live", framerate=15, resolution="1280x720",
+                     profiles=PRINTING_PROFILE, logger=MagicMock())
+        idle_args = FfmpegBackend(s).build_command()
+        self.assertNotIn('-skip_frame', idle_args)
+
+        self.assertTrue(s.set_profile(PRINTING))
+        self.assertFalse(s.set_profile(PRINTING))
+        args = FfmpegBackend(s).build_command()
+        self.assertEqual(args[args.index('-s') + 1], '320x240')
+        self.assertEqual(args[args.index('-skip_frame') + 1], 'nokey')
+        self.assertLess(args.index('-skip_frame'), args.index('-i'))
+        self.assertNotIn('-r', args)  # keyframes come at the camera's GOP rate
+
+        self.assertTrue(s.set_profile(IDLE))
+        self.assertEqual(FfmpegBackend(s).build_command(), idle_args)
+
+    def test_keyframes_only_passes_frames_through(self):
+        s = Streamor("rtsp://cam/live", framerate=15, keyframes_only=True, logger=MagicMock())
+        backend = FfmpegBackend(s)
+
+        # Unprobed: the spelling every version understands
+        args = backend.build_command()
+        self.assertEqual(args[args.index('-vsync') + 1], '0')
+        self.assertNotIn('-r', args)
+
+        backend.capabilities = FfmpegCapabilities("ffmpeg", "6.1", options=["fps_mode", "vsync"])
+        args = backend.build_command()
+        self.assertEqual(args[args.index('-fps_mode') + 1], 'passthrough')
+        self.assertNotIn('-vsync', args)
+
+        backend.capabilities = FfmpegCapabilities("ffmpeg", "4.2", options=["vsync"])
+        self.assertIn('-vsync', backend.build_command())
+
+        # Region outputs too
+        s = Streamor("rtsp://cam/live", keyframes_only=True, regions=dict(nozzle=Region(0, 0, 50, 50)),
+                     logger=MagicMock())
+        self.assertEqual(FfmpegBackend(s).build_command(region_fds=dict(nozzle=5)).count('-vsync'), 2)
+
+        s.keyframes_only = False
+        args = FfmpegBackend(s).build_command()
+        self.assertNotIn('-vsync', args)
+        self.assertIn('-r', args)
+
+    def test_unknown_profile_is_ignored(self):
+        s = Streamor("rtsp://cam/live", logger=MagicMock())
+        self.assertFalse(s.set_profile(PRINTING))
+        self.assertEqual(s.profile, IDLE)
+
+    def test_profile_keeps_adaptive_level(self):
+        s = Streamor("rtsp://cam/live", framerate=15, adaptive_quality=True,
+                     profiles={PRINTING: dict(framerate=6)}, logger=MagicMock())
+        s.controller.level = 1
+        s.set_profile(PRINTING)
+        self.assertEqual(s.operating_point, s.controller.ladder[1])
+        self.assertEqual(s.controller.ladder[0].framerate, 6)
+
+@unittest.skipUnless(PipelineCpuMeter.available(), "needs psutil")
+class TestCpuAccounting(unittest.TestCase):
+    def test_meter_counts_child_process_cpu(self):
+        busy = subprocess.Popen([sys.executable, '-c', 'import time\nt=time.time()\nwhile time.time()-t<0.5: pass'])
+        meter = PipelineCpuMeter()
+        meter.sample([busy.pid])
+        time.sleep(0.3)
+        used = meter.sample([busy.pid])
+        busy.wait()
+        self.assertGreater(used, 0.1)
+
+    def test_usage_is_reported_per_profile(self):
+        s = Streamor("TEST", framerate=200, poster_interval=0,
+                     profiles={PRINTING: dict(framerate=2)}, logger=MagicMock())
+        s.start()
+        try:
+            time.sleep(0.5)
+            s.set_profile(PRINTING)
+            time.sleep(0.5)
+            usage = s.get_stats()['profiles']
+        finally:
+            s.stop()
+
+        self.assertAlmostEqual(usage[IDLE]['seconds'], 0.5, delta=0.2)
+        self.assertAlmostEqual(usage[PRINTING]['seconds'], 0.5, delta=0.2)
+        self.assertIsNotNone(usage[PRINTING]['cpu_saved_percent'])
+        self.assertNotIn('cpu_saved_percent', usage[IDLE])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import helpers  # puts the package on sys.path
+
+from octoprint_rtsp.ptz import PtzClient, PtzQueueFull
+
+class _CameraHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Authorization")))
+        server.release.wait(5)
+        status = 404 if self.path.startswith("/missing") else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"OK")
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+class TestPtzClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _CameraHandler)
+        self.server.requests = []
+        self.server.connections = 0
+        self.server.release = threading.Event()
+        self.server.release.set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.client = PtzClient(max_pending=2, timeout=2)
+
+    def tearDown(self):
+        self.server.release.set()
+        self.client.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_for(self, command_id):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            status = self.client.get_status(command_id)
+            if status["status"] in ("done", "failed"):
+                return status
+            time.sleep(0.01)
+        self.fail("PTZ command did not finish")
+
+    def test_commands_reuse_one_connection(self):
+        for direction in ("left", "right", "up"):
+            command = self.client.submit(direction, f"{self.base}/ptz?move={direction}")
+            self.assertEqual(self.wait_for(command["id"])["status"], "done")
+
+        self.assertEqual([r[0] for r in self.server.requests],
+                         ["/ptz?move=left", "/ptz?move=right", "/ptz?move=up"])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_repeated_presses_coalesced_and_queue_bounded(self):
+        self.server.release.clear()  # camera hangs on the first command
+        first = self.client.submit("left", f"{self.base}/ptz?move=left")
+        deadline = time.time() + 5
+        while self.client.get_status(first["id"])["status"] != "sending" and time.time() < deadline:
+            time.sleep(0.01)
+
+        right = self.client.submit("right", f"{self.base}/ptz?move=right")
+        again = self.client.submit("right", f"{self.base}/ptz?move=right")
+        self.assertEqual(again["id"], right["id"])
+        self.assertEqual(again["coalesced"], 1)
+        self.assertNotIn("url", again)
+
+        self.client.submit("up", f"{self.base}/ptz?move=up")
+        with self.assertRaises(PtzQueueFull):
+            self.client.submit("down", f"{self.base}/ptz?move=down")
+
+        self.server.release.set()
+        self.assertEqual(self.wait_for(right["id"])["status"], "done")
+        self.assertEqual(len([r for r in self.server.requests if r[0] == "/ptz?move=right"]), 1)
+
+    def test_failures_and_credentials(self):
+        url = self.base.replace("http://", "http://admin:p%40ss@") + "/missing"
+        command = self.client.submit("home", url)
+        status = self.wait_for(command["id"])
+        self.assertEqual(status["status"], "failed")
+        self.assertIn("404", status["error"])
+        self.assertEqual(self.server.requests[0][1], "Basic YWRtaW46cEBzcw==")
+
+if __name__ == '__main__':
+    unittest.main()
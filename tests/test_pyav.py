@@ -0,0 +1,153 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import fractions
+import threading
+import time
+
+from helpers import wait_until
+
+from octoprint_rtsp import backends
+from octoprint_rtsp.backends import PyAvBackend
+from octoprint_rtsp.streamor import Streamor
+
+class FakePacket:
+    """What PyAV's demux yields for an MJPEG stream: one JPEG per packet."""
+
+    time_base = fractions.Fraction(1, 90000)
+
+    def __init__(self, index, fps=30):
+        self.data = b'\xff\xd8packet-%d\xff\xd9' % index
+        self.size = len(self.data)
+        self.pts = index * 90000 // fps
+
+    def __bytes__(self):
+        return self.data
+
+class FakeContainer:
+    """av.open() result. close() records the thread it was called on."""
+
+    def __init__(self, codec="mjpeg", packets=None):
+        self.stream = MagicMock()
+        self.stream.codec_context.name = codec
+        self.streams = MagicMock()
+        self.streams.video = [self.stream]
+        self.packets = packets
+        self.closed_on = None
+
+    def demux(self, stream):
+        if self.packets is not None:
+            yield from self.packets
+            return
+        index = 0
+        # A live camera: packets until the container is closed
+        while self.closed_on is None:
+            yield FakePacket(index)
+            index += 1
+            time.sleep(0.005)
+
+    def close(self):
+        self.closed_on = threading.current_thread()
+
+class TestPyAvBackend(unittest.TestCase):
+    def setUp(self):
+        self.av = MagicMock()
+        self.containers = []
+        self.av.open.side_effect = self.open
+        patcher = patch.object(backends, 'av', self.av)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def open(self, url, options=None, timeout=None):
+        container = self.make_container()
+        self.containers.append(container)
+        return container
+
+    def make_container(self):
+        return FakeContainer()
+
+    def streamor(self, **kwargs):
+        s = Streamor("rtsp://fake", framerate=10, backend="pyav", poster_interval=0,
+                     logger=MagicMock(), **kwargs)
+        s._publish = MagicMock()
+        return s
+
+    def run_backend(self, s):
+        backend = PyAvBackend(s)
+        s.running = True
+        thread = threading.Thread(target=backend.run, daemon=True)
+        thread.start()
+        return backend, thread
+
+    def stop_backend(self, s, backend, thread):
+        s.running = False
+        backend.stop()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+
+    def test_mjpeg_is_passed_through(self):
+        s = self.streamor()
+        backend, thread = self.run_backend(s)
+        try:
+            self.assertTrue(wait_until(lambda: s._publish.call_count >= 2))
+            self.assertTrue(backend.passthrough)
+            jpg = s._publish.call_args[0][0]
+            self.assertTrue(jpg.startswith(b'\xff\xd8packet-'))
+            self.av.filter.Graph.assert_not_called()
+            self.assertEqual(self.av.open.call_args[1]['timeout'],
+                             (PyAvBackend.OPEN_TIMEOUT, PyAvBackend.READ_TIMEOUT))
+        finally:
+            self.stop_backend(s, backend, thread)
+
+    def test_orientation_needs_a_transcode(self):
+        s = self.streamor(flip_h=True)
+        self.make_container = lambda: FakeContainer(packets=[])
+        backend = PyAvBackend(s)
+        s.running = True
+        with patch.object(backend, '_run_transcode') as transcode:
+            transcode.side_effect = lambda *args: setattr(s, 'running', False)
+            backend.run()
+        self.assertFalse(backend.passthrough)
+        self.assertEqual(transcode.call_args[0][1], [("hflip", "")])
+
+        s = self.streamor()
+        self.make_container = lambda: FakeContainer(codec="h264", packets=[])
+        backend = PyAvBackend(s)
+        s.running = True
+        with patch.object(backend, '_run_transcode') as transcode:
+            transcode.side_effect = lambda *args: setattr(s, 'running', False)
+            backend.run()
+        self.assertFalse(backend.passthrough)
+        transcode.assert_called_once()
+
+    def test_passthrough_drops_packets_above_the_frame_rate(self):
+        # 3 s of a 30 fps camera, all in one burst - timestamps decide
+        s = self.streamor()
+        packets = [FakePacket(i) for i in range(90)]
+        backend = PyAvBackend(s)
+        backend._container = FakeContainer(packets=packets)
+        s.running = True
+        backend._run_passthrough(backend._container.stream)
+
+        published = [call[0][0] for call in s._publish.call_args_list]
+        self.assertEqual(len(published), 30)
+        self.assertEqual(published[:2], [bytes(packets[0]), bytes(packets[3])])
+
+    def test_reconfigure_reopens_on_the_capture_thread(self):
+        s = self.streamor()
+        backend, thread = self.run_backend(s)
+        try:
+            self.assertTrue(wait_until(lambda: s._publish.call_count > 0))
+            backend.reconfigure()
+            self.assertTrue(wait_until(lambda: len(self.containers) == 2))
+            first = self.containers[0]
+            self.assertIs(first.closed_on, thread)
+            self.assertEqual(backend.restarts, 1)
+            s.logger.error.assert_not_called()
+        finally:
+            self.stop_backend(s, backend, thread)
+        # stop() only flagged it - the capture thread closed it on the way out
+        self.assertIs(self.containers[1].closed_on, thread)
+        self.assertEqual(len(self.containers), 2)
+
+if __name__ == '__main__':
+    unittest.main()
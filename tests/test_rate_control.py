@@ -0,0 +1,130 @@
+import unittest
+from unittest.mock import MagicMock
+
+import helpers  # puts the package on sys.path
+
+from octoprint_rtsp.rate_control import QualityController, OperatingPoint, build_ladder
+from octoprint_rtsp.streamor import Streamor
+from octoprint_rtsp.backends import FfmpegBackend
+
+def signals(cpu=30.0, speed=1.0, fps_ratio=1.0, delivery=None):
+    return dict(cpu=cpu, speed=speed, capture_fps=15 * fps_ratio, fps_ratio=fps_ratio,
+                delivery=delivery, client_throughput=0)
+
+class TestQualityController(unittest.TestCase):
+    def setUp(self):
+        self.streamor = Streamor("rtsp://cam/live", framerate=15, logger=MagicMock())
+        self.streamor.set_operating_point = MagicMock()
+        self.controller = QualityController(self.streamor, down_after=2, up_after=3, hold=30)
+        self.now = 1000.0
+
+    def feed(self, n, **kwargs):
+        for _ in range(n):
+            self.now += 5
+            self.controller.update(signals(**kwargs), self.now)
+
+    def test_ladder_degrades_monotonically(self):
+        ladder = build_ladder(15)
+        self.assertEqual(ladder[0], OperatingPoint(5, 15, 1.0))
+        for better, worse in zip(ladder, ladder[1:]):
+            self.assertGreater(worse.quality, better.quality)
+            self.assertLessEqual(worse.framerate, better.framerate)
+            self.assertLessEqual(worse.scale, better.scale)
+        # A 1 fps stream can't drop frame rate - no duplicate steps
+        self.assertEqual(len(set(build_ladder(1))), len(build_ladder(1)))
+
+    def test_steps_down_only_after_sustained_pressure(self):
+        self.feed(1, cpu=95)
+        self.assertEqual(self.controller.level, 0)
+        self.feed(1, cpu=30)  # blip - counter resets
+        self.feed(1, cpu=95)
+        self.assertEqual(self.controller.level, 0)
+        self.feed(1, cpu=95)
+        self.assertEqual(self.controller.level, 1)
+        self.streamor.set_operating_point.assert_called_once_with(build_ladder(15)[1])
+        self.assertIn("cpu", self.controller.reason)
+
+    def test_each_signal_counts_as_pressure(self):
+        self.feed(2, speed=0.7)
+        self.assertEqual(self.controller.level, 1)
+        self.feed(2, delivery=0.5)
+        self.assertEqual(self.controller.level, 2)
+        # Without ffmpeg progress the captured frame rate stands in for speed
+        self.feed(2, speed=None, fps_ratio=0.5)
+        self.assertEqual(self.controller.level, 3)
+        # ...but not when ffmpeg says it keeps up (slow camera, not lag)
+        self.feed(4, speed=1.0, fps_ratio=0.5, cpu=70)
+        self.assertEqual(self.controller.level, 3)
+
+    def test_steps_up_after_headroom_and_hold(self):
+        self.feed(2, cpu=95)
+        self.assertEqual(self.controller.level, 1)
+        self.feed(3, cpu=20)  # enough samples but only 15s since the change
+        self.assertEqual(self.controller.level, 1)
+        self.feed(3, cpu=20)
+        self.assertEqual(self.controller.level, 0)
+        # In-between load neither steps up nor down
+        self.feed(2, cpu=95)
+        self.feed(10, cpu=70)
+        self.assertEqual(self.controller.level, 1)
+
+    def test_backs_off_when_oscillating(self):
+        self.feed(2, cpu=95)
+        self.feed(6, cpu=20)
+        self.assertEqual(self.controller.level, 0)
+        # Stepping up immediately caused pressure again
+        self.feed(2, cpu=95)
+        self.assertEqual(self.controller.level, 1)
+        self.assertEqual(self.controller.hold, 60)
+        self.feed(6, cpu=20)  # 30s - previously enough, now held
+        self.assertEqual(self.controller.level, 1)
+        self.feed(6, cpu=20)
+        self.assertEqual(self.controller.level, 0)
+
+    def test_floor_and_state(self):
+        self.feed(40, cpu=99)
+        self.assertEqual(self.controller.level, len(self.controller.ladder) - 1)
+        state = self.controller.get_state()
+        self.assertEqual(state['operating_point'], self.controller.ladder[-1]._asdict())
+        self.assertEqual(state['signals']['cpu'], 99)
+
+    def test_sample_reads_streamor_counters(self):
+        s = Streamor("rtsp://cam/live", framerate=10, logger=MagicMock())
+        controller = QualityController(s, cpu_percent=lambda: 42.0)
+        self.assertIsNone(controller.sample(0.0))
+        for i in range(20):
+            s._publish(b'\xff\xd8%d\xff\xd9' % i)
+        s.count_client_frame(1000, skipped=0)
+        s.count_client_frame(1000, skipped=3)
+        sampled = controller.sample(2.0)
+        self.assertEqual(sampled['capture_fps'], 10.0)
+        self.assertEqual(sampled['fps_ratio'], 1.0)
+        self.assertEqual(sampled['delivery'], 0.4)
+        self.assertEqual(sampled['client_throughput'], 1000)
+        self.assertEqual(sampled['cpu'], 42.0)
+
+class TestOperatingPointCommand(unittest.TestCase):
+    def test_ffmpeg_command_follows_operating_point(self):
+        s = Streamor("rtsp://cam/live", framerate=15, resolution="640x480", logger=MagicMock())
+        s.operating_point = OperatingPoint(14, 7, 0.75)
+        args = FfmpegBackend(s).build_command()
+        self.assertEqual(args[args.index('-q:v') + 1], '14')
+        self.assertEqual(args[args.index('-r') + 1], '7')
+        self.assertEqual(args[args.index('-s') + 1], '480x360')
+
+    def test_unscaled_source_gets_scale_filter(self):
+        s = Streamor("rtsp://cam/live", logger=MagicMock())
+        s.operating_point = OperatingPoint(18, 5, 0.5)
+        args = FfmpegBackend(s).build_command()
+        self.assertNotIn('-s', args)
+        self.assertIn('scale=trunc(iw*0.5/2)*2:-2', args[args.index('-vf') + 1])
+
+    def test_stats_expose_operating_point(self):
+        s = Streamor("rtsp://cam/live", adaptive_quality=True, logger=MagicMock())
+        stats = s.get_stats()
+        self.assertEqual(stats['operating_point'], dict(quality=5, framerate=15, scale=1.0))
+        self.assertEqual(stats['adaptive']['level'], 0)
+        self.assertIsNone(Streamor("rtsp://cam/live", logger=MagicMock()).get_stats()['adaptive'])
+
+if __name__ == '__main__':
+    unittest.main()
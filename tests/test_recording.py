@@ -0,0 +1,103 @@
+import unittest
+import os
+import time
+import tempfile
+
+import helpers  # puts the package on sys.path
+
+from octoprint_rtsp.recording import FrameRecorder, RecordingError, read_recording
+from octoprint_rtsp.streamor import Streamor
+
+FRAMES = [b'\xff\xd8frame%d\xff\xd9' % i for i in range(20)]
+
+class TestRecording(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'capture.orec')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def record(self, interval=0.01):
+        recorder = FrameRecorder(self.path)
+        for i, frame in enumerate(FRAMES):
+            recorder.write(frame, now=recorder.started + i * interval)
+        recorder.close()
+
+    def test_roundtrip_keeps_frames_and_timing(self):
+        self.record(interval=0.5)
+        replayed = list(read_recording(self.path))
+        self.assertEqual([f for _, f in replayed], FRAMES)
+        self.assertAlmostEqual(replayed[-1][0], 19 * 0.5)
+
+    def test_recorder_caps_size(self):
+        recorder = FrameRecorder(self.path, max_bytes=80)  # 22 bytes per record
+        self.assertTrue(recorder.write(FRAMES[0]))
+        self.assertTrue(recorder.write(FRAMES[1]))
+        self.assertTrue(recorder.write(FRAMES[2]))
+        self.assertTrue(recorder.write(FRAMES[3]))
+        self.assertFalse(recorder.active)
+        self.assertFalse(recorder.write(FRAMES[4]))
+        self.assertEqual(len(list(read_recording(self.path))), 4)
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\xff\xd8not a recording')
+        with self.assertRaises(RecordingError):
+            list(read_recording(self.path))
+
+    def test_streamor_records_captured_frames(self):
+        s = Streamor("rtsp://fake", suppress_static=True, poster_interval=0)
+        s.start_recording(self.path)
+        for frame in FRAMES[:3] + [FRAMES[2]]:
+            s._publish(frame)
+        info = s.stop_recording()
+        # Recorded before suppression - replay sees what the camera sent
+        self.assertEqual(info['frames'], 4)
+        self.assertEqual([f for _, f in read_recording(self.path)], FRAMES[:3] + [FRAMES[2]])
+
+    def replay(self, speed, loop=False):
+        s = Streamor(self.path, backend="replay", replay_speed=speed, replay_loop=loop,
+                     poster_interval=0)
+        published = []
+        original = s._publish
+        s._publish = lambda jpg: published.append(jpg) or original(jpg)
+        s.start()
+        return s, published
+
+    def test_replay_at_max_speed(self):
+        self.record(interval=1.0)  # 19s of "real" time
+        started = time.monotonic()
+        s, published = self.replay(speed=0)
+        try:
+            self.assertTrue(s.backend.finished.wait(5))
+        finally:
+            s.stop()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(published, FRAMES)
+        self.assertEqual(s.get_stats()['frames_captured'], len(FRAMES))
+
+    def test_replay_keeps_original_timing_scaled(self):
+        self.record(interval=0.05)  # 0.95s recording
+        started = time.monotonic()
+        s, published = self.replay(speed=2.0)
+        try:
+            self.assertTrue(s.backend.finished.wait(5))
+        finally:
+            s.stop()
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
+        self.assertEqual(len(published), len(FRAMES))
+
+    def test_replay_loops(self):
+        self.record(interval=0.0)
+        s, published = self.replay(speed=0, loop=True)
+        try:
+            deadline = time.time() + 5
+            while len(published) < len(FRAMES) * 3 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            s.stop()
+        self.assertGreaterEqual(s.backend.loops, 2)
+
+if __name__ == '__main__':
+    unittest.main()
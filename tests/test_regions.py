@@ -0,0 +1,163 @@
+import unittest
+from unittest.mock import MagicMock
+import os
+import time
+
+from helpers import FAKE_FFMPEG, wait_until
+
+from octoprint_rtsp.regions import Region, crop_filter, parse_regions
+from octoprint_rtsp.backends import FfmpegBackend
+from octoprint_rtsp.sources import SourceSet
+from octoprint_rtsp.streamor import Streamor
+
+REGIONS = dict(nozzle=Region(40, 30, 20, 20), bed=Region(10, 20, 80, 70))
+
+class TestParseRegions(unittest.TestCase):
+    def test_parse(self):
+        regions, errors = parse_regions("nozzle = 40,30,20,20\n\n bed=10, 20, 80, 70 ")
+        self.assertEqual(regions, REGIONS)
+        self.assertEqual(errors, [])
+        self.assertEqual(parse_regions("nozzle=40,30,20,20; bed=10,20,80,70")[0], REGIONS)
+        self.assertEqual(parse_regions(None), ({}, []))
+
+    def test_bad_lines_are_skipped(self):
+        regions, errors = parse_regions("nozzle=40,30,20,20\n"
+                                        "no equals sign\n"
+                                        "bad name=1,2,3,4\n"
+                                        "short=1,2,3\n"
+                                        "outside=50,50,60,10\n"
+                                        "empty=10,10,0,10\n"
+                                        "text=a,b,c,d")
+        self.assertEqual(list(regions), ["nozzle"])
+        self.assertEqual(len(errors), 6)
+
+    def test_crop_filter(self):
+        self.assertEqual(crop_filter(Region(40, 30, 20, 20)),
+                         "crop='max(2,trunc(iw*0.2/2)*2)':'max(2,trunc(ih*0.2/2)*2)':trunc(iw*0.4):trunc(ih*0.3)")
+        self.assertEqual(crop_filter(Region(0, 0, 100, 12.5)),
+                         "crop='max(2,trunc(iw*1/2)*2)':'max(2,trunc(ih*0.125/2)*2)':trunc(iw*0):trunc(ih*0)")
+
+    def test_small_region_on_a_small_frame_is_never_empty(self):
+        # ffmpeg's expression functions, for the frame sizes the crop sees
+        functions = dict(max=max, trunc=int)
+        width, height = crop_filter(Region(50, 50, 1, 0.5))[len("crop="):].split(":")[:2]
+        for iw, ih in ((160, 120), (320, 240), (1920, 1080)):
+            for expression, size in ((width, iw), (height, ih)):
+                value = eval(expression.strip("'"), functions, dict(iw=iw, ih=ih))
+                self.assertGreaterEqual(value, 2)
+                self.assertEqual(value % 2, 0)
+                self.assertLessEqual(value, size)
+        self.assertEqual(eval(width.strip("'"), functions, dict(iw=160)), 2)
+
+class TestRegionCommand(unittest.TestCase):
+    def backend(self, **kwargs):
+        s = Streamor("rtsp://fake", framerate=10, poster_interval=0, regions=REGIONS,
+                     logger=MagicMock(), **kwargs)
+        return FfmpegBackend(s)
+
+    def test_one_decode_split_into_crops(self):
+        command = self.backend(flip_h=True).build_command(progress_fd=3, region_fds=dict(nozzle=5, bed=6))
+        self.assertEqual(command.count('-i'), 1)
+        self.assertNotIn('-vf', command)
+        graph = command[command.index('-filter_complex') + 1]
+        self.assertEqual(graph, "[0:v]hflip,split=3[main][r0][r1];"
+                                f"[r0]{crop_filter(REGIONS['nozzle'])}[roi0];"
+                                f"[r1]{crop_filter(REGIONS['bed'])}[roi1]")
+
+        # Main output on stdout, each crop on its pipe at the same rate
+        outputs = [i for i, arg in enumerate(command) if arg == '-' or arg in ('pipe:5', 'pipe:6')]
+        self.assertEqual([command[i] for i in outputs], ['-', 'pipe:5', 'pipe:6'])
+        maps = [command[i + 1] for i, arg in enumerate(command) if arg == '-map']
+        self.assertEqual(maps, ['[main]', '[roi0]', '[roi1]'])
+        self.assertEqual(command.count('-r'), 3)
+        self.assertEqual(command.count('mjpeg'), 3)
+
+    def test_scaling_only_applies_to_the_main_output(self):
+        backend = self.backend(operating_point=(5, 10, 0.5))
+        command = backend.build_command(region_fds=dict(nozzle=5))
+        graph = command[command.index('-filter_complex') + 1]
+        self.assertIn("[main]scale=trunc(iw*0.5/2)*2:-2[scaled]", graph)
+        self.assertEqual(command[command.index('-map') + 1], '[scaled]')
+
+    def test_without_region_fds(self):
+        command = self.backend(flip_v=True).build_command()
+        self.assertEqual(command[command.index('-vf') + 1], 'vflip')
+        self.assertNotIn('-filter_complex', command)
+        self.assertNotIn('-map', command)
+        self.assertNotIn('-filter_complex', self.backend().build_command(still_quality=2))
+
+@unittest.skipUnless(FfmpegBackend.regions, "POSIX only")
+class TestRegionStreams(unittest.TestCase):
+    def streamor(self, backend="ffmpeg"):
+        return Streamor("rtsp://fake", framerate=30, ffmpeg_path=FAKE_FFMPEG, poster_interval=0,
+                        backend=backend, regions=REGIONS, logger=MagicMock())
+
+    def check_renditions(self, s):
+        s.start()
+        try:
+            nozzle, bed = s.regions['nozzle'], s.regions['bed']
+            self.assertTrue(nozzle.running and bed.running)
+            self.assertIn(b'fake-frame', s.wait_for_frame(timeout=5))
+            self.assertIn(b'fake-roi-0', nozzle.wait_for_frame(timeout=5))
+            self.assertIn(b'fake-roi-1', bed.wait_for_frame(timeout=5))
+            self.assertTrue(wait_until(lambda: nozzle.frame_seq >= 5 and bed.frame_seq >= 5))
+
+            stats = s.get_stats()['regions']
+            self.assertEqual(stats['nozzle']['x'], 40)
+            self.assertGreater(stats['bed']['frames_published'], 0)
+        finally:
+            s.stop()
+        self.assertFalse(nozzle.running or bed.running)
+        self.assertIsNone(nozzle.get_snapshot())
+
+    def test_ffmpeg_backend(self):
+        self.check_renditions(self.streamor())
+
+    def test_asyncio_backend(self):
+        self.check_renditions(self.streamor("asyncio"))
+
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'), "needs /proc")
+    def test_restarts_leak_no_fds(self):
+        s = self.streamor()
+        s.start()
+        try:
+            self.assertTrue(s.regions['nozzle'].wait_for_frame(timeout=5))
+            fds = len(os.listdir('/proc/self/fd'))
+            for i in range(5):
+                restarts = s.backend.restarts
+                s.backend.reconfigure()
+                self.assertTrue(wait_until(lambda: s.backend.restarts > restarts and s.backend.process))
+            seq = s.regions['nozzle'].frame_seq
+            self.assertTrue(wait_until(lambda: s.regions['nozzle'].frame_seq > seq))
+            self.assertEqual(len(os.listdir('/proc/self/fd')), fds)
+        finally:
+            s.stop()
+
+    def test_backend_without_regions(self):
+        s = Streamor("TEST", framerate=30, poster_interval=0, regions=REGIONS, logger=MagicMock())
+        s.start()
+        try:
+            self.assertFalse(s.regions['nozzle'].running)
+            s.logger.warning.assert_called_once()
+        finally:
+            s.stop()
+
+    def test_region_viewers_keep_the_source_open(self):
+        s = Streamor("TEST", framerate=30, poster_interval=0, regions=REGIONS, logger=MagicMock())
+        sources = SourceSet(dict(main=s), idle_timeout=0.01, logger=MagicMock())
+        sources.acquire()
+        try:
+            s.regions['nozzle'].clients = 1
+            time.sleep(0.05)
+            sources.close_idle()
+            self.assertTrue(s.running)
+
+            s.regions['nozzle'].clients = 0
+            time.sleep(0.05)
+            sources.close_idle()
+            self.assertFalse(s.running)
+        finally:
+            sources.stop()
+
+if __name__ == '__main__':
+    unittest.main()
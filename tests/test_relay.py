@@ -0,0 +1,155 @@
+import unittest
+from unittest.mock import patch
+import os
+import io
+import time
+import tempfile
+import http.client
+
+from helpers import wait_until
+
+import octoprint_rtsp
+from octoprint_rtsp.backends import MultipartReader, RelayBackend
+from octoprint_rtsp.streamor import Streamor
+from fake_ffmpeg import FRAME
+from soak import Server, make_plugin
+
+POSTER = b'\xff\xd8\xff\xe0poster-frame\xff\xd9'
+
+class TestMultipartReader(unittest.TestCase):
+    def test_parts_by_content_length(self):
+        body = (b'--frame\r\nContent-Type: image/jpeg\r\nX-Frame-Stale: 1\r\nContent-Length: 6\r\n\r\n'
+                b'\xff\xd8ab\xff\xd9\r\n'
+                b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: 8\r\n\r\n'
+                b'\xff\xd8\xff\xd9cd\xff\xd9\r\n'
+                b'--frame\r\nContent-Length: 100\r\n\r\ntruncated')
+        reader = MultipartReader(io.BytesIO(body))
+        headers, frame = reader.read_part()
+        self.assertEqual(headers['x-frame-stale'], '1')
+        self.assertEqual(frame, b'\xff\xd8ab\xff\xd9')
+        # An EOI marker inside the frame doesn't cut it short
+        self.assertEqual(reader.read_part()[1], b'\xff\xd8\xff\xd9cd\xff\xd9')
+        self.assertIsNone(reader.read_part())
+
+    def test_without_content_length_falls_back_to_splitter(self):
+        body = (b'--myboundary\r\nContent-Type: image/jpeg\r\n\r\n'
+                b'\xff\xd8one\xff\xd9\r\n--myboundary\r\n\r\n\xff\xd8two\xff\xd9\r\n')
+        reader = MultipartReader(io.BytesIO(body))
+        self.assertEqual(reader.read_part(), ({}, b'\xff\xd8one\xff\xd9'))
+        self.assertEqual(reader.read_part(), ({}, b'\xff\xd8two\xff\xd9'))
+        self.assertIsNone(reader.read_part())
+
+@unittest.skipUnless(os.name == 'posix', "fake ffmpeg is a POSIX script")
+@patch.object(RelayBackend, 'reconnect_delay', 0.1)
+class TestRelay(unittest.TestCase):
+    """Relays from the plugin's own /stream handler, served by Tornado in-process
+    the way OctoPrint serves it (see soak.py), with fake ffmpeg as the camera."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.servers = [Server()]
+        self.plugin = make_plugin(self.tmp.name, "ffmpeg", self.servers[0].loop)
+        octoprint_rtsp._plugin_instance = self.plugin
+        self.relays = []
+
+    def tearDown(self):
+        for relay in self.relays:
+            relay.stop()
+        if self.plugin._sources:
+            self.plugin._sources.stop()
+        octoprint_rtsp._plugin_instance = None
+        for server in self.servers:
+            server.close()
+        self.tmp.cleanup()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.servers[0].port}/stream"
+
+    def write_poster(self):
+        with open(os.path.join(self.tmp.name, 'poster.jpg'), 'wb') as f:
+            f.write(POSTER)
+
+    def relay(self, **kwargs):
+        kwargs.setdefault('framerate', 50)
+        streamor = Streamor(self.url, backend="relay", poster_interval=0,
+                            poster_path=os.path.join(self.tmp.name, 'relay.jpg'), **kwargs)
+        # Everything the relay publishes, in order
+        streamor.received = []
+        publish = streamor._publish
+        streamor._publish = lambda jpg: streamor.received.append(jpg) or publish(jpg)
+        streamor.start()
+        self.relays.append(streamor)
+        return streamor
+
+    def test_cold_start_answers_with_the_poster(self):
+        self.write_poster()
+        connection = http.client.HTTPConnection('127.0.0.1', self.servers[0].port, timeout=5)
+        try:
+            connection.request("GET", "/stream")
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.getheader('Content-Type'), 'multipart/x-mixed-replace; boundary=frame')
+            self.assertEqual(response.getheader('Connection'), 'close')
+            self.assertEqual(response.getheader('X-First-Frame-Stale'), '1')
+
+            reader = MultipartReader(response)
+            headers, frame = reader.read_part()
+            self.assertEqual(frame, POSTER)
+            self.assertEqual(headers['x-frame-stale'], '1')
+            # Then live frames, not marked
+            headers, frame = reader.read_part()
+            self.assertEqual(frame, FRAME)
+            self.assertNotIn('x-frame-stale', headers)
+        finally:
+            connection.close()
+
+    def test_frames_pass_through_unchanged(self):
+        self.write_poster()
+        relay = self.relay()
+
+        self.assertTrue(wait_until(lambda: relay.get_stats()['frames_captured'] >= 10))
+        # The upstream's stale poster is not relayed as a live frame
+        self.assertNotIn(POSTER, relay.received)
+        self.assertEqual(set(relay.received), {FRAME})
+        self.assertEqual(relay.get_snapshot(), FRAME)
+        stats = relay.get_stats()
+        self.assertEqual(stats['backend'], 'relay')
+        self.assertTrue(stats['relay']['connected'])
+        self.assertEqual(stats['restarts'], 0)
+
+    def test_operating_point_frame_rate_skips_frames(self):
+        relay = self.relay(framerate=5)
+        self.assertTrue(wait_until(lambda: relay.get_stats()['relay']['frames_skipped'] >= 20))
+        self.assertLess(relay.get_stats()['frames_captured'], 10)
+
+    def test_reconnects_after_upstream_restart(self):
+        relay = self.relay()
+        self.assertTrue(wait_until(lambda: relay.get_stats()['frames_captured'] > 0))
+
+        port = self.servers[0].port
+        self.servers.pop().close()
+        self.assertTrue(wait_until(lambda: not relay.get_stats()['relay']['connected']))
+        captured = relay.get_stats()['frames_captured']
+        time.sleep(0.3)  # a couple of refused reconnects
+
+        self.servers.append(Server(port))
+        self.assertTrue(wait_until(lambda: relay.get_stats()['frames_captured'] > captured + 5))
+        self.assertGreaterEqual(relay.get_stats()['restarts'], 1)
+
+    def test_stop_interrupts_blocking_read(self):
+        # An idle upstream: fake ffmpeg's frames never change, so after the
+        # first one nothing more is sent
+        self.plugin._settings.data.update(suppress_static=True, suppress_keepalive=3600)
+        relay = self.relay()
+        self.assertTrue(wait_until(lambda: relay.get_stats()['frames_captured'] == 1))
+        self.assertTrue(relay.get_stats()['relay']['connected'])
+
+        thread = relay.thread
+        started = time.time()
+        relay.stop()
+        self.assertFalse(thread.is_alive())
+        self.assertLess(time.time() - started, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+import time
+import asyncio
+import shutil
+import subprocess
+import threading
+
+from helpers import FAKE_FFMPEG
+
+from octoprint_rtsp.scheduling import SchedulingProfile, parse_cpu_list
+from octoprint_rtsp.streamor import Streamor
+from octoprint_rtsp.backends import FfmpegBackend
+
+# The test process's own scheduling, which profiles must leave alone
+NICE = os.getpriority(os.PRIO_PROCESS, 0) if hasattr(os, 'getpriority') else None
+AFFINITY = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else None
+
+class TestSchedulingProfile(unittest.TestCase):
+    def test_parse_cpu_list(self):
+        self.assertEqual(parse_cpu_list("1-3,5"), [1, 2, 3, 5])
+        self.assertEqual(parse_cpu_list(" 2, 0 "), [0, 2])
+        self.assertIsNone(parse_cpu_list(""))
+        with self.assertRaises(ValueError):
+            parse_cpu_list("all")
+
+    def test_empty_profile_is_falsy(self):
+        self.assertFalse(SchedulingProfile())
+        self.assertFalse(SchedulingProfile(ionice="realtime"))  # not allowed
+        self.assertTrue(SchedulingProfile(nice=10))
+
+    def test_invalid_affinity_is_reported_not_raised(self):
+        profile = SchedulingProfile(cpu_affinity="core0")
+        self.assertIsNone(profile.cpu_affinity)
+        self.assertIn("invalid cpu affinity 'core0'", profile.apply(os.getpid())["errors"])
+
+    @unittest.skipUnless(hasattr(os, 'sched_setaffinity'), "Linux only")
+    def test_apply_to_child(self):
+        cpu = min(os.sched_getaffinity(0))
+        child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(5)'])
+        try:
+            logger = MagicMock()
+            effective = SchedulingProfile(nice=15, ionice="idle", cpu_affinity=str(cpu)).apply(child.pid, logger)
+        finally:
+            child.kill()
+            child.wait()
+        self.assertEqual(effective["nice"], 15)
+        self.assertEqual(effective["cpu_affinity"], [cpu])
+        self.assertEqual(effective["errors"], [])
+        logger.warning.assert_not_called()
+
+    @unittest.skipUnless(os.path.isdir('/proc/self/task'), "Linux only")
+    def test_spawning_thread_passes_it_to_every_child_thread(self):
+        cpu = min(os.sched_getaffinity(0))
+        profile = SchedulingProfile(nice=15, cpu_affinity=str(cpu))
+        code = ('import threading, time\n'
+                'for _ in range(3): threading.Thread(target=time.sleep, args=(5,), daemon=True).start()\n'
+                'time.sleep(5)')
+
+        def threads_of(child):
+            deadline = time.time() + 5
+            while len(os.listdir(f'/proc/{child.pid}/task')) < 4 and time.time() < deadline:
+                time.sleep(0.02)
+            return SchedulingProfile.effective(child.pid)
+
+        # Applied on the (capture) thread that spawns: every thread has it
+        children = []
+
+        def capture_thread():
+            self.assertEqual(profile.apply_current(), [])
+            children.append(subprocess.Popen([sys.executable, '-c', code]))
+        thread = threading.Thread(target=capture_thread)
+        thread.start()
+        thread.join()
+        child = children[0]
+        try:
+            effective = threads_of(child)
+        finally:
+            child.kill()
+            child.wait()
+        self.assertEqual(effective["nice"], 15)
+        self.assertEqual(effective["cpu_affinity"], [cpu])
+        # ... and only that thread of ours
+        self.assertEqual(os.getpriority(os.PRIO_PROCESS, 0), NICE)
+        self.assertIn(cpu, os.sched_getaffinity(0))
+        self.assertEqual(os.sched_getaffinity(0), AFFINITY)
+
+        # Applied to the pid afterwards: the threads escaped, and it shows
+        child = subprocess.Popen([sys.executable, '-c', code])
+        try:
+            threads_of(child)
+            effective = profile.apply(child.pid)
+        finally:
+            child.kill()
+            child.wait()
+        self.assertEqual(effective["nice"], NICE)
+
+    @unittest.skipUnless(shutil.which('nice') and shutil.which('taskset'), "needs nice and taskset")
+    def test_command_prefix(self):
+        cpu = min(os.sched_getaffinity(0))
+        prefix = SchedulingProfile(nice=NICE + 12, cpu_affinity=str(cpu)).command_prefix()
+        self.assertEqual(prefix, (['nice', '-n', '12', 'taskset', '-c', str(cpu)], []))
+        if shutil.which('ionice'):
+            self.assertEqual(SchedulingProfile(ionice="idle").command_prefix(), (['ionice', '-c', '3'], []))
+            self.assertEqual(SchedulingProfile(ionice="best-effort").command_prefix()[0],
+                             ['ionice', '-c', '2', '-n', '7'])
+
+        # Missing tools are left out and reported
+        with patch('shutil.which', return_value=None):
+            self.assertEqual(SchedulingProfile(nice=12).command_prefix(), ([], ["nice: command not found"]))
+
+    def test_nothing_to_apply_at_spawn(self):
+        self.assertEqual(SchedulingProfile().command_prefix(), ([], []))
+        self.assertEqual(SchedulingProfile(threads=2).command_prefix(), ([], []))
+        self.assertIsNone(SchedulingProfile(threads=2).apply_current())
+
+    def test_ffmpeg_thread_cap_applies_to_decoder_and_encoder(self):
+        s = Streamor("rtsp://cam/live", scheduling=SchedulingProfile(threads=2), logger=MagicMock())
+        args = FfmpegBackend(s).build_command()
+        positions = [i for i, arg in enumerate(args) if arg == '-threads']
+        self.assertEqual(len(positions), 2)
+        self.assertLess(positions[0], args.index('-i'))
+        self.assertGreater(positions[1], args.index('-i'))
+        self.assertNotIn('-threads', FfmpegBackend(Streamor("rtsp://cam/live")).build_command())
+
+@unittest.skipUnless(hasattr(os, 'sched_setaffinity'), "Linux only")
+class TestSchedulingAtSpawn(unittest.TestCase):
+    def spawn(self, backend, loop=None):
+        cpu = min(os.sched_getaffinity(0))
+        s = Streamor("rtsp://fake", ffmpeg_path=FAKE_FFMPEG, poster_interval=0, backend=backend, loop=loop,
+                     scheduling=SchedulingProfile(nice=12, cpu_affinity=str(cpu)),
+                     logger=MagicMock())
+        s.start()
+        try:
+            deadline = time.time() + 5
+            while not s.get_snapshot() and time.time() < deadline:
+                time.sleep(0.05)
+            scheduling = s.get_stats()['scheduling']
+            pid = s.backend.process.pid
+        finally:
+            s.stop()
+
+        self.assertEqual(scheduling['profile']['nice'], 12)
+        self.assertEqual(scheduling['effective']['pid'], pid)
+        self.assertEqual(scheduling['effective']['nice'], 12)
+        self.assertEqual(scheduling['effective']['cpu_affinity'], [cpu])
+        # Nothing of it leaked into the server
+        self.assertEqual(os.getpriority(os.PRIO_PROCESS, 0), NICE)
+        self.assertEqual(os.sched_getaffinity(0), AFFINITY)
+
+    def test_ffmpeg_is_spawned_with_profile(self):
+        self.spawn("ffmpeg")
+
+    @unittest.skipUnless(shutil.which('nice') and shutil.which('taskset'), "needs nice and taskset")
+    def test_asyncio_backend_leaves_the_loop_thread_alone(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        try:
+            self.spawn("asyncio", loop)
+            scheduling = asyncio.run_coroutine_threadsafe(self.loop_scheduling(), loop).result(5)
+            self.assertEqual(scheduling, (NICE, AFFINITY))
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    async def loop_scheduling(self):
+        return os.getpriority(os.PRIO_PROCESS, 0), os.sched_getaffinity(0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,19 @@
+import unittest
+import os
+
+import helpers  # puts the package on sys.path
+
+from soak import run_soak
+
+@unittest.skipUnless(os.path.isdir('/proc/self/fd'), "needs /proc")
+class TestSoak(unittest.TestCase):
+    """A short run of tests/soak.py - release gating uses thousands of cycles."""
+
+    def test_short_soak_stays_flat(self):
+        report = run_soak(cycles=15, warmup=3)
+        for phase in report['phases']:
+            self.assertEqual(phase['failures'], [], phase['phase'])
+        self.assertTrue(report['passed'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import os
+import time
+import tempfile
+import threading
+
+from helpers import wait_until
+
+from octoprint_rtsp.sources import MAIN, SUB, SourceSet
+from octoprint_rtsp.streamor import Streamor
+
+class TestSourceSet(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.main = self.streamor('main.jpg')
+        self.sub = self.streamor('sub.jpg')
+
+    def tearDown(self):
+        self.main.stop()
+        self.sub.stop()
+        self.tmp.cleanup()
+
+    def streamor(self, poster):
+        return Streamor("TEST", framerate=50, poster_interval=0,
+                        poster_path=os.path.join(self.tmp.name, poster))
+
+    def test_falls_back_to_main_without_sub_stream(self):
+        sources = SourceSet({MAIN: self.main}, idle_timeout=0)
+        self.assertEqual(sources.select(SUB), MAIN)
+        self.assertIs(sources.acquire(SUB), self.main)
+        self.assertIs(sources.acquire("bogus"), self.main)
+        sources.stop()
+
+    def test_sources_open_lazily(self):
+        sources = SourceSet({MAIN: self.main, SUB: self.sub}, idle_timeout=0)
+        self.assertIs(sources.acquire(SUB), self.sub)
+        self.assertTrue(self.sub.running)
+        self.assertFalse(self.main.running)
+        self.assertEqual(sources.get_stats()[MAIN]['idle'], None)
+        sources.stop()
+
+    def test_idle_sources_close(self):
+        sources = SourceSet({MAIN: self.main, SUB: self.sub}, idle_timeout=0.3, interval=0.05)
+        sources.acquire(MAIN)
+        sub = sources.acquire(SUB)
+        sub.clients = 1  # a viewer keeps the sub stream open
+
+        self.assertTrue(wait_until(lambda: not self.main.running))
+        time.sleep(0.3)
+        self.assertTrue(self.sub.running)
+
+        sub.clients = 0
+        self.assertTrue(wait_until(lambda: not self.sub.running))
+        self.assertTrue(wait_until(lambda: sources._thread is None))
+
+        # Reopened on the next request, without the frame from before the stop
+        self.assertIsNone(self.main.get_snapshot())
+        self.assertTrue(sources.acquire(MAIN).wait_for_frame())
+        self.assertIsNotNone(sources._thread)
+        sources.stop()
+
+    def test_recording_keeps_the_source_open_until_it_ends(self):
+        sources = SourceSet({MAIN: self.main}, idle_timeout=0.2, interval=0.05)
+        sources.acquire(MAIN)
+        # Closes itself after 0.1 s, well before the source would idle out
+        self.main.start_recording(os.path.join(self.tmp.name, 'rec.bin'), max_duration=0.1)
+        try:
+            self.assertTrue(wait_until(lambda: not self.main.recorder.active, timeout=2))
+            self.assertTrue(self.main.running)
+            self.assertTrue(wait_until(lambda: not self.main.running, timeout=2))
+            self.assertIsNotNone(self.main.recorder)
+        finally:
+            sources.stop()
+
+    def test_stopping_an_idle_source_does_not_block_requests(self):
+        sources = SourceSet({MAIN: self.main, SUB: self.sub}, idle_timeout=0.01)
+        sources.acquire(MAIN)
+        stop = self.main.stop
+
+        def slow_stop():
+            time.sleep(0.5)  # joining capture, waiting for ffmpeg
+            stop()
+        self.main.stop = slow_stop
+
+        time.sleep(0.02)
+        closing = threading.Thread(target=sources.close_idle)
+        closing.start()
+        try:
+            time.sleep(0.1)
+            started = time.monotonic()
+            self.assertIs(sources.acquire(SUB), self.sub)
+            # Requested again while it is being stopped: restarted afterwards
+            self.assertIs(sources.acquire(MAIN), self.main)
+            self.assertLess(time.monotonic() - started, 0.2)
+        finally:
+            closing.join()
+        self.assertTrue(self.main.running)
+        self.assertTrue(self.main.wait_for_frame())
+        sources.stop()
+
+if __name__ == '__main__':
+    unittest.main()
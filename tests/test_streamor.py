@@ -4,11 +4,14 @@ import sys
 import os
 import time
 import threading
+import logging
+import tempfile
 
-# Add package to path
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from helpers import FAKE_FFMPEG
 
 from octoprint_rtsp.streamor import Streamor
+from octoprint_rtsp.backends import FfmpegBackend, JpegSplitter, LumaReader, create_backend
+from octoprint_rtsp.rate_control import OperatingPoint
 
 class TestStreamor(unittest.TestCase):
     @patch('subprocess.Popen')
@@ -60,5 +63,228 @@ class TestStreamor(unittest.TestCase):
         # Clean up
         s.stop()
 
+    def test_static_frames_suppressed_until_keepalive(self):
+        s = Streamor("rtsp://fake", suppress_static=True, suppress_threshold=1.0,
+                     suppress_keepalive=60.0)
+        frame = b'\xff\xd8' + b'a' * 100000 + b'\xff\xd9'
+
+        self.assertTrue(s._publish(frame))
+        self.assertFalse(s._publish(frame))
+        self.assertFalse(s._publish(frame))
+
+        stats = s.get_stats()
+        self.assertEqual(stats['frames_captured'], 3)
+        self.assertEqual(stats['frames_published'], 1)
+        self.assertEqual(stats['frames_suppressed'], 2)
+        self.assertEqual(stats['bytes_suppressed'], len(frame) * 2)
+
+        # Keepalive forces a send even though nothing changed
+        s.suppress_keepalive = 0.0
+        self.assertTrue(s._publish(frame))
+
+    def test_without_luma_only_repeated_frames_are_static(self):
+        s = Streamor("rtsp://fake", suppress_static=True, suppress_threshold=1.0,
+                     suppress_keepalive=60.0)
+        frame = b'\xff\xd8' + b'a' * 100000 + b'\xff\xd9'
+        self.assertTrue(s._publish(frame))
+        # Same sampled bytes, 0.5% larger - not the same frame
+        self.assertTrue(s._publish(frame[:-2] + b'a' * 500 + b'\xff\xd9'))
+
+    def test_luma_thumbnail_decides_when_available(self):
+        s = Streamor("rtsp://fake", suppress_static=True, suppress_threshold=1.0,
+                     suppress_keepalive=60.0)
+        flat = [128] * 576
+
+        def luma(cell=0, change=0):
+            values = list(flat)
+            values[cell] += change
+            return bytes(values)
+
+        s._luma = luma()
+        self.assertTrue(s._publish(b'\xff\xd8noise-1\xff\xd9'))
+        # Different JPEG bytes (sensor noise), one cell 0.8% brighter: static
+        s._luma = luma(100, 2)
+        self.assertFalse(s._publish(b'\xff\xd8noise-2\xff\xd9'))
+        # Compared with the last *sent* frame, so slow drift adds up
+        s._luma = luma(100, 4)
+        self.assertTrue(s._publish(b'\xff\xd8noise-3\xff\xd9'))
+        # One cell of 576 moving is enough
+        s._luma = luma(7, -10)
+        self.assertTrue(s._publish(b'\xff\xd8noise-4\xff\xd9'))
+        self.assertEqual(s.get_stats()['frames_suppressed'], 1)
+
+    def test_changed_frame_of_the_same_size_is_published(self):
+        s = Streamor("rtsp://fake", suppress_static=True, suppress_threshold=1.0,
+                     suppress_keepalive=60.0)
+        frame = b'\xff\xd8' + b'a' * 1000 + b'\xff\xd9'
+        moved = b'\xff\xd8' + b'a' * 500 + b'b' * 500 + b'\xff\xd9'
+
+        self.assertTrue(s._publish(frame))
+        self.assertTrue(s._publish(moved))
+        self.assertEqual(s.get_stats()['frames_suppressed'], 0)
+
+    def test_suppression_disabled_publishes_everything(self):
+        s = Streamor("rtsp://fake")
+        frame = b'\xff\xd8same\xff\xd9'
+        self.assertTrue(s._publish(frame))
+        self.assertTrue(s._publish(frame))
+        self.assertEqual(s.get_stats()['frames_suppressed'], 0)
+
+    def test_poster_frame_persisted_and_reloaded(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'poster.jpg')
+            s = Streamor("rtsp://fake", poster_path=path, poster_interval=60.0)
+            self.assertEqual(s.get_poster(), (None, None))
+
+            s._publish(b'\xff\xd8first\xff\xd9')
+            s._publish(b'\xff\xd8second\xff\xd9')  # within the interval - not written
+
+            # A fresh instance (e.g. after an OctoPrint restart) has it at hand
+            restarted = Streamor("rtsp://fake", poster_path=path)
+            poster, age = restarted.get_poster()
+            self.assertEqual(poster, b'\xff\xd8first\xff\xd9')
+            self.assertLess(age, 60)
+            self.assertIsNone(restarted.get_snapshot())
+            self.assertFalse(os.path.exists(path + '.tmp'))
+
+    @unittest.skipUnless(os.name == 'posix', "progress pipe is POSIX only")
+    def test_monitor_stderr_parses_progress_pipe(self):
+        import subprocess
+        read_fd, write_fd = os.pipe()
+        script = (
+            "import os, sys\n"
+            f"os.write({write_fd}, b'frame=42\\nfps=15.0\\ndrop_frames=2\\nspeed=1.01x\\nprogress=continue\\n')\n"
+            "sys.stderr.write('[rtsp @ 0x1] Connection timed out\\n')\n"
+        )
+        process = subprocess.Popen([sys.executable, '-c', script],
+                                   stderr=subprocess.PIPE, pass_fds=(write_fd,))
+        os.close(write_fd)
+
+        s = Streamor("rtsp://fake", logger=MagicMock())
+        s.backend = FfmpegBackend(s)
+        s.backend._monitor_output(process, read_fd)
+        process.wait()
+
+        stats = s.get_stats()
+        self.assertEqual(stats['ffmpeg']['frames'], 42)
+        self.assertEqual(stats['ffmpeg']['drop_frames'], 2)
+        self.assertEqual(stats['ffmpeg_log']['errors'], 1)
+        s.logger.log.assert_called_with(logging.ERROR, "FFmpeg: [rtsp @ 0x1] Connection timed out")
+
+    @unittest.skipUnless(os.name == 'posix', "fake ffmpeg is a POSIX script")
+    def test_capture_with_fake_ffmpeg(self):
+        s = Streamor("rtsp://fake", framerate=30, ffmpeg_path=FAKE_FFMPEG, poster_interval=0)
+        s.start()
+        try:
+            deadline = time.time() + 10
+            while (s.get_stats()['frames_captured'] < 40 or not s.get_stats()['ffmpeg']) \
+                    and time.time() < deadline:
+                time.sleep(0.05)
+
+            self.assertIn(b'fake-frame', s.get_snapshot())
+            self.assertGreaterEqual(s.get_stats()['ffmpeg']['frames'], 30)
+            self.assertIn('-timeout', s.backend.build_command())
+        finally:
+            s.stop()
+
+    def test_luma_output_from_the_same_decode(self):
+        s = Streamor("rtsp://fake", framerate=10, flip_h=True, suppress_static=True, poster_interval=0)
+        command = FfmpegBackend(s).build_command(luma_fd=7)
+        self.assertEqual(command[command.index('-filter_complex') + 1],
+                         "[0:v]hflip,split=2[main][l];[l]scale=32:18:flags=area,format=gray[luma]")
+        self.assertEqual(command[command.index('[luma]') - 1:],
+                         ['-map', '[luma]', '-f', 'rawvideo', '-pix_fmt', 'gray', '-r', '10', 'pipe:7'])
+        self.assertNotIn('[luma]', FfmpegBackend(s).build_command())
+
+    def test_luma_reader_handles_split_reads(self):
+        reader = LumaReader()
+        self.assertEqual(reader.feed(b'\x01' * 500), [])
+        self.assertEqual(reader.feed(b'\x01' * 76 + b'\x02' * 600), [b'\x01' * 576, b'\x02' * 576])
+        self.assertEqual(reader.feed(b'\x02' * 552), [b'\x02' * 576])
+
+    @unittest.skipUnless(FfmpegBackend.regions, "POSIX only")
+    def test_capture_keeps_luma_current(self):
+        for backend in ("ffmpeg", "asyncio"):
+            with self.subTest(backend=backend):
+                s = Streamor("rtsp://fake", framerate=30, ffmpeg_path=FAKE_FFMPEG, poster_interval=0,
+                             backend=backend, suppress_static=True, suppress_keepalive=60.0)
+                s.start()
+                try:
+                    deadline = time.time() + 10
+                    while s.get_stats()['frames_suppressed'] < 5 and time.time() < deadline:
+                        time.sleep(0.05)
+                    self.assertEqual(s._luma, b'\x80' * 576)
+                    self.assertGreaterEqual(s.get_stats()['frames_suppressed'], 5)
+                finally:
+                    s.stop()
+                self.assertIsNone(s._luma)
+
+    def test_jpeg_splitter_handles_split_reads(self):
+        splitter = JpegSplitter()
+        self.assertEqual(splitter.feed(b'garbage\xff\xd8one'), [])
+        self.assertEqual(splitter.feed(b'\xff'), [])
+        self.assertEqual(splitter.feed(b'\xd9\xff\xd8two\xff\xd9\xff\xd8th'),
+                         [b'\xff\xd8one\xff\xd9', b'\xff\xd8two\xff\xd9'])
+        self.assertEqual(splitter.feed(b'ree\xff\xd9'), [b'\xff\xd8three\xff\xd9'])
+
+    def test_backend_selection(self):
+        self.assertEqual(Streamor("TEST", backend="ffmpeg").backend_name, "test")
+        s = Streamor("rtsp://fake", backend="nonexistent", logger=MagicMock())
+        self.assertIsInstance(create_backend(s.backend_name, s), FfmpegBackend)
+
+    def test_test_pattern_backend(self):
+        s = Streamor("TEST", framerate=50, poster_interval=0)
+        s.start()
+        try:
+            deadline = time.time() + 5
+            while not s.get_snapshot() and time.time() < deadline:
+                time.sleep(0.02)
+            self.assertTrue(s.get_snapshot().startswith(b'\xff\xd8'))
+            self.assertEqual(s.get_stats()['backend'], 'test')
+        finally:
+            s.stop()
+
+    def test_wait_for_frame(self):
+        s = Streamor("rtsp://fake", poster_interval=0)
+        self.assertIsNone(s.wait_for_frame(timeout=0.05))
+        threading.Timer(0.1, s._publish, args=(b'\xff\xd8late\xff\xd9',)).start()
+        started = time.time()
+        self.assertEqual(s.wait_for_frame(timeout=5), b'\xff\xd8late\xff\xd9')
+        self.assertLess(time.time() - started, 2)
+
+    @unittest.skipUnless(os.name == 'posix', "fake ffmpeg is a POSIX script")
+    def test_still_uses_separate_full_quality_ffmpeg(self):
+        log = os.path.join(tempfile.mkdtemp(), 'invocations.log')
+        s = Streamor("rtsp://fake", resolution="640x480", ffmpeg_path=FAKE_FFMPEG,
+                     poster_interval=0, logger=MagicMock())
+        s.operating_point = OperatingPoint(14, 7, 0.5)  # degraded live stream
+        with patch.dict(os.environ, {'FAKE_FFMPEG_LOG': log}):
+            still = s.capture_still(quality=2, timeout=10)
+        self.assertTrue(still.startswith(b'\xff\xd8'))
+
+        with open(log) as f:
+            command = [line.split() for line in f if '-i' in line.split()][-1]
+        self.assertEqual(command[command.index('-q:v') + 1], '2')
+        self.assertEqual(command[command.index('-frames:v') + 1], '1')
+        self.assertEqual(command[command.index('-s') + 1], '640x480')
+        self.assertNotIn('-progress', command)
+        # The live pipeline was never started or touched
+        self.assertFalse(s.running)
+        self.assertEqual(s.operating_point, OperatingPoint(14, 7, 0.5))
+
+    def test_still_falls_back_to_live_frame(self):
+        s = Streamor("TEST", poster_interval=0)
+        s.start()
+        try:
+            self.assertTrue(s.capture_still(timeout=5).startswith(b'\xff\xd8'))
+        finally:
+            s.stop()
+        # Never started for a still, and not waited on while stopped
+        started = time.time()
+        self.assertIsNone(s.capture_still(timeout=5))
+        self.assertLess(time.time() - started, 1)
+        self.assertFalse(s.running)
+
 if __name__ == '__main__':
     unittest.main()
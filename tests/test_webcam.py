@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import patch
+import os
+import time
+import tempfile
+
+import helpers  # puts the package on sys.path
+
+import octoprint_rtsp
+from octoprint_rtsp import (WEBCAM_LIVE, WEBCAM_REGION, WEBCAM_STILL, WEBCAM_SUB,
+                            WebcamNotAbleToTakeSnapshotException)
+from octoprint_rtsp.backends import FfmpegBackend
+from octoprint_rtsp.sources import MAIN, SUB
+from fake_ffmpeg import FRAME
+from soak import make_plugin
+
+@unittest.skipIf(octoprint_rtsp.Webcam is None, "needs OctoPrint 1.9+")
+@unittest.skipUnless(os.name == 'posix', "fake ffmpeg is a POSIX script")
+class TestWebcamProvider(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.plugin = make_plugin(self.tmp.name, "ffmpeg", None)
+        self.plugin._settings.data.update(rtsp_sub_url="rtsp://fake-sub", regions="nozzle=40,30,20,20")
+
+    def tearDown(self):
+        if self.plugin._sources:
+            self.plugin._sources.stop()
+        self.tmp.cleanup()
+
+    def snapshot(self, name):
+        return next(self.plugin.take_webcam_snapshot(name))
+
+    def test_configurations(self):
+        webcams = {webcam.name: webcam for webcam in self.plugin.get_webcam_configurations()}
+        self.assertEqual(list(webcams), [WEBCAM_LIVE, WEBCAM_STILL, WEBCAM_SUB, WEBCAM_REGION + "nozzle"])
+        self.assertEqual(webcams[WEBCAM_SUB].compat.stream, "/plugin/rtsp/stream?source=sub")
+        self.assertEqual(webcams[WEBCAM_REGION + "nozzle"].compat.snapshot, "/plugin/rtsp/snapshot?roi=nozzle")
+        self.assertTrue(all(webcam.canSnapshot for webcam in webcams.values()))
+
+        self.plugin._settings.data.update(rtsp_url="")
+        self.assertEqual(self.plugin.get_webcam_configurations(), [])
+
+    def test_names_map_to_sources(self):
+        self.assertEqual(self.snapshot(WEBCAM_SUB), FRAME)
+        sources = self.plugin._sources
+        self.assertTrue(sources.get(SUB).running)
+        self.assertFalse(sources.get(MAIN).running)
+
+        self.assertIn(b'fake-roi-0', self.snapshot(WEBCAM_REGION + "nozzle"))
+        self.assertTrue(sources.get(MAIN).running)
+        self.assertEqual(self.snapshot(WEBCAM_LIVE), FRAME)
+
+    def test_still_does_not_start_the_live_stream(self):
+        log = os.path.join(self.tmp.name, 'invocations.log')
+        with patch.dict(os.environ, {'FAKE_FFMPEG_LOG': log}):
+            self.assertEqual(self.snapshot(WEBCAM_STILL), FRAME)
+        self.assertFalse(self.plugin._sources.get(MAIN).running)
+
+        # One RTSP session: the still's own one-shot ffmpeg
+        with open(log) as f:
+            sessions = [line.split() for line in f if '-i' in line.split()]
+        self.assertEqual(len(sessions), 1)
+        self.assertIn('-frames:v', sessions[0])
+
+    def test_still_falls_back_to_a_running_stream(self):
+        with patch.object(FfmpegBackend, 'capture_still', return_value=None):
+            started = time.time()
+            with self.assertRaises(WebcamNotAbleToTakeSnapshotException):
+                self.snapshot(WEBCAM_STILL)
+            self.assertLess(time.time() - started, 1)
+            self.assertFalse(self.plugin._sources.get(MAIN).running)
+
+            self.snapshot(WEBCAM_LIVE)
+            self.assertEqual(self.snapshot(WEBCAM_STILL), FRAME)
+
+    def test_no_frame_raises(self):
+        with self.assertRaises(WebcamNotAbleToTakeSnapshotException):
+            self.snapshot(WEBCAM_REGION + "missing")
+
+        self.plugin.on_settings_save({})
+        with patch.object(self.plugin._sources.get(SUB), 'wait_for_frame', return_value=None):
+            with self.assertRaises(WebcamNotAbleToTakeSnapshotException):
+                self.snapshot(WEBCAM_SUB)
+
+if __name__ == '__main__':
+    unittest.main()